@@ -0,0 +1,75 @@
+import argparse, importlib.util, os, random, time
+
+# Benchmark of TN CNV gene bucketing: the original per-event substring loops against the cached, table-driven
+# classifier (bucket_cnv_genes), on synthetic CNV-heavy reports. Both are checked to give the same gene lists.
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+spec = importlib.util.spec_from_file_location("parse_mci_jsons", os.path.join(repo_dir, "scripts", "Parse-MCI_JSONs.py"))
+mci = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mci)
+
+copy_number_types = ["Loss", "Gain", "Amplification", "Copy-neutral LOH", "Biallelic loss", "Focal deletion", "Focal Gain",
+                     "Whole chromosome gain", "Complete loss", "Homozygous deletion", "Loss of Heterozygosity", "ROH",
+                     "Total loss", "Deletion", "Focal amplification (exon 2-5)", "Unknown"]
+genes = ["TP53", "NF1", "CDKN2A", "CDKN2B", "EGFR", "MYCN", "PTEN", "RB1", "BRAF", "KIAA1549", "H3F3A", "SMARCB1", "ALK", "PDGFRA", "N/A"]
+
+def make_cnv_lists(reports:int, cnvs_per_report:int):
+    random.seed(0)
+    return [[{"copy_number_type":random.choice(copy_number_types), "disease_associated_gene_content":random.sample(genes, random.randint(1, 6))}
+             for j in range(cnvs_per_report)] for i in range(reports)]
+
+def legacy_bucket_cnv_genes(cnv_variants:list, origin:str):
+    # The per-event loop used before the classifier, with its final set/discard/sort step.
+    gene_changes = {"Loss":[], "BiallelicLoss":[], "Gain":[], "Amplification":[], "LOH":[]}
+    for v in cnv_variants:
+        copy_type = v['copy_number_type'].lower()
+        if 'bialle' in copy_type or 'complet' in copy_type or 'total' in copy_type:
+            gene_changes['BiallelicLoss'].extend(v['disease_associated_gene_content'])
+        elif 'loh' in copy_type or 'hetero' in copy_type or 'roh' in copy_type or 'homo' in copy_type:
+            gene_changes['LOH'].extend(v['disease_associated_gene_content'])
+        elif 'gain' in copy_type:
+            gene_changes['Gain'].extend(v['disease_associated_gene_content'])
+        elif 'ampli' in copy_type:
+            gene_changes['Amplification'].extend(v['disease_associated_gene_content'])
+        elif 'loss' in copy_type or (origin == "Germline" and 'del' in copy_type):
+            gene_changes['Loss'].extend(v['disease_associated_gene_content'])
+    out_dict = {}
+    for i in gene_changes:
+        gene_set = set(gene_changes[i])
+        gene_set.discard("N/A")
+        gene_set.discard("NA")
+        gene_set.discard("n/a")
+        gene_set.discard("")
+        if len(gene_changes[i]) > 0:
+            out_dict[i] = sorted(gene_set)
+    return out_dict
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of TN CNV gene bucketing.")
+    parser.add_argument('--reports', type=int, default=2000, help="Number of synthetic TN reports.")
+    parser.add_argument('--cnvs-per-report', type=int, default=200, help="CNV events per report and origin.")
+    parser.add_argument('--repeats', type=int, default=3, help="Timed repeats; the fastest is reported.")
+    args = parser.parse_args()
+
+    cnv_lists = make_cnv_lists(args.reports, args.cnvs_per_report)
+    print(f"{args.reports} reports with {args.cnvs_per_report} CNVs each, for both origins.\n")
+
+    for origin in ["Somatic", "Germline"]:
+        legacy = [legacy_bucket_cnv_genes(i, origin) for i in cnv_lists]
+        assert legacy == mci.bucket_cnv_genes_batch(cnv_lists, origin), f"{origin} gene lists differ"
+
+    timings = {}
+    for name, function in [("per-event loops", lambda: [legacy_bucket_cnv_genes(i, o) for o in ["Somatic", "Germline"] for i in cnv_lists]),
+                           ("table classifier", lambda: [mci.bucket_cnv_genes_batch(cnv_lists, o) for o in ["Somatic", "Germline"]])]:
+        best = None
+        for r in range(args.repeats):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+        print(f"{name:<18}{best*1000:>10.1f} ms")
+    print(f"\nSpeed-up: {timings['per-event loops']/timings['table classifier']:.2f}x")
+
+if __name__ == "__main__":
+    main()
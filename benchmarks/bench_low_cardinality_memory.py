@@ -0,0 +1,87 @@
+import argparse, gc, importlib.util, json, os, random, tracemalloc
+
+# Memory benchmark for interning and categorical encoding of low-cardinality data dictionary columns.
+# Builds a synthetic cohort, with each subject's row decoded from its own JSON string as in a real run,
+# and compares the retained row memory and DataFrame memory of:
+#   list-of-dicts   - rows as plain dicts, copied into a DataFrame (the original approach)
+#   row store       - RowStore without interning or categoricals
+#   row store + cat - RowStore with the data dictionary's low-cardinality columns interned and categorical
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+spec = importlib.util.spec_from_file_location("parse_mci_jsons", os.path.join(repo_dir, "scripts", "Parse-MCI_JSONs.py"))
+mci = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mci)
+
+low_cardinality_values = {
+    "Sex":["Male", "Female", "Unknown"],
+    "Ethnicity":["Hispanic or Latino", "Not Hispanic or Latino", "Unknown"],
+    "Race":["White", "Black or African American", "Asian", "Unknown"],
+    "Vital_status":["Alive", "Dead", "Alive;Alive", "Alive;Dead"],
+    "Disease_Group":["CNS", "Sarcoma", "Other"],
+    "Methylation_Version":["DKFZ v11b4", "DKFZ v12.8", "IGM v1"],
+    "MGMT_Status":["Methylated", "Unmethylated"]
+}
+
+def make_subject_json(subject:int, columns:list, low_cardinality:set):
+    row = {}
+    for c in columns:
+        if c in low_cardinality:
+            row[c] = random.choice(low_cardinality_values.get(c, ["Positive", "Negative"]))
+        elif random.random() < 0.5:
+            row[c] = f"{c} value {random.randint(0, 10**6)}"
+    row["Sample"] = f"SUBJ{subject:07d}"
+    return json.dumps(row)
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, retained
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory benchmark for low-cardinality interning and categorical columns.")
+    parser.add_argument('--subjects', type=int, default=100000, help="Number of synthetic subjects.")
+    parser.add_argument('--data-dict-reference', default=os.path.join(repo_dir, "resources", "mci_data_dict.txt"))
+    args = parser.parse_args()
+
+    import pandas as pd
+    data_dict_table = pd.read_csv(args.data_dict_reference, delimiter="\t", header=0, index_col=0, keep_default_na=False)
+    columns = list(data_dict_table['Term'])
+    low_cardinality = mci.get_low_cardinality_columns(data_dict_table)
+
+    random.seed(0)
+    subject_jsons = [make_subject_json(i, columns, low_cardinality) for i in range(args.subjects)]
+    print(f"{args.subjects} subjects, {len(columns)} columns, {len(low_cardinality)} low-cardinality columns.\n")
+
+    def build_dicts():
+        return [json.loads(i) for i in subject_jsons]
+
+    def build_store(interned:bool):
+        store = mci.RowStore(columns, len(subject_jsons), low_cardinality=low_cardinality if interned else None)
+        for i in subject_jsons:
+            store.append(json.loads(i))
+        return store
+
+    results = []
+    rows, rows_memory = measure(build_dicts)
+    df = pd.DataFrame(rows, columns=columns)
+    results.append(("list-of-dicts", rows_memory, df.memory_usage(deep=True).sum()))
+    del rows, df
+
+    store, store_memory = measure(lambda: build_store(False))
+    results.append(("row store", store_memory, store.to_dataframe(categorical=False).memory_usage(deep=True).sum()))
+    del store
+
+    store, store_memory = measure(lambda: build_store(True))
+    results.append(("row store + cat", store_memory, store.to_dataframe().memory_usage(deep=True).sum()))
+    del store
+
+    print(f"{'Layout':<18}{'Rows (MB)':>12}{'DataFrame (MB)':>16}")
+    for name, rows_memory, df_memory in results:
+        print(f"{name:<18}{rows_memory/1024**2:>12.1f}{df_memory/1024**2:>16.1f}")
+
+if __name__ == "__main__":
+    main()
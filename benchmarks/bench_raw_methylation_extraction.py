@@ -0,0 +1,73 @@
+import argparse, importlib.util, json, os, random, tempfile, time, tracemalloc
+
+# Benchmark of reading a raw methylation JSON: reading and fully decoding the file with json.loads, against read_file_bytes,
+# which checks the head of large files and memory-maps and extracts only the paths the v11 raw parser reads.
+# Both are checked to give the same values.
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+spec = importlib.util.spec_from_file_location("parse_mci_jsons", os.path.join(repo_dir, "scripts", "Parse-MCI_JSONs.py"))
+mci = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mci)
+
+def write_raw_file(path:str, beta_values:int, title_last:bool):
+    # Synthetic v11 raw file. With title_last, the report title comes after the beta values, so extraction has to skip them.
+    random.seed(0)
+    raw = {"family_data":[{"methylation_family":"MCF ETMR", "family_score":random.random()} for i in range(50)],
+           "class_data":[{"methylation_class":"MB, WNT", "class_score":random.random()} for i in range(50)],
+           "mgmt_methylation_data":[{"mgmt_methylation_status":"Unmethylated"}],
+           "beta_values":[random.random() for i in range(beta_values)]}
+    if title_last:
+        raw["meta_data"] = {"report_title":"Methylation v11 raw"}
+    else:
+        raw = {"meta_data":{"report_title":"Methylation v11 raw"}, **raw}
+    with open(path, 'w') as out_file:
+        json.dump(raw, out_file)
+
+def full_decode(path:str):
+    with open(path, 'rb') as in_file:
+        return json.loads(in_file.read(), object_pairs_hook=mci.handle_duplicates)
+
+def partial_extraction(path:str):
+    # The path sort_jsons takes: large raw methylation files come back from read_file_bytes already extracted.
+    contents, mtime = mci.read_file_bytes(path)
+    if isinstance(contents, mci.ExtractedReport):
+        return contents.json_data
+    return mci.extract_raw_methylation(contents) or json.loads(contents, object_pairs_hook=mci.handle_duplicates)
+
+def measure(path:str, function, repeats:int):
+    # Returns the result, the fastest time and the peak of memory allocated while reading the file.
+    best = None
+    for r in range(repeats):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = function(path)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of raw methylation JSON extraction.")
+    parser.add_argument('--beta-values', type=int, default=2000000, help="Number of beta values in the synthetic file.")
+    parser.add_argument('--repeats', type=int, default=3, help="Timed repeats; the fastest is reported.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for title_last in [False, True]:
+            path = os.path.join(tmp_dir, "x-PAT00001-raw.json")
+            write_raw_file(path, args.beta_values, title_last)
+            print(f"{os.path.getsize(path)/1024/1024:.1f} MiB file, report title {'after' if title_last else 'before'} the beta values.")
+
+            full, full_seconds, full_peak = measure(path, full_decode, args.repeats)
+            extracted, extract_seconds, extract_peak = measure(path, partial_extraction, args.repeats)
+            assert extracted["meta_data"]["report_title"] == full["meta_data"]["report_title"], "Report titles differ"
+            for i in ["family_data", "class_data", "mgmt_methylation_data"]:
+                assert extracted[i][0] == full[i][0], f"{i} differs"
+
+            print(f"{'read + json.loads':<20}{full_seconds*1000:>10.1f} ms{full_peak/1024/1024:>10.1f} MiB peak")
+            print(f"{'read_file_bytes':<20}{extract_seconds*1000:>10.1f} ms{extract_peak/1024/1024:>10.1f} MiB peak")
+            print(f"Speed-up: {full_seconds/extract_seconds:.2f}x\n")
+
+if __name__ == "__main__":
+    main()
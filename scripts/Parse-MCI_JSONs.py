@@ -1,4 +1,4 @@
-import glob, json, os, copy
+import glob, json, os, copy, sys, time
 import argparse
 
 ## Hard-coded Reference Paths
@@ -44,6 +44,351 @@ def handle_duplicates(pairs):
             print(f"Deduplicated {key} to {new_key}")
     return result
 
+## Field Projection
+
+# Report types needed to populate the fields of each data dictionary 'JSON Source'.
+source_json_types = {
+    "All":[],
+    "COG":["cog"],
+    "Tumor-Normal":["tumor_normal"],
+    "Methylation":["methyl_igm", "methyl_v11", "methyl_v12", "methyl_v11_raw"],
+    "Archer":["archer_fusion"],
+    "Molecular":["tumor_normal", "methyl_igm", "methyl_v11", "methyl_v12", "archer_fusion"]
+}
+
+# Output fields populated from each COG form. Forms with no requested fields are not parsed.
+cog_form_fields = {
+    "DEMOGRAPHY":["Birth_Date", "Ethnicity", "Race", "Sex", "Country_of_Residence"],
+    "COG_UPR_DX":["Diagnosis_ID", "Enrolled_Dx", "Date_of_Diagnosis", "Primary_Site_Code", "Primary_Site_Term", "Initial_Dx_Code", "Initial_Dx_Term", "Registry_Stage_Code"],
+    "REGISTRY_DATA":["Date_of_Death"],
+    "FINAL_DIAGNOSIS":["Dx_Morpho_Code", "Primary_Dx_Disease_Group"],
+    "TREATMENT_CONFIRMATION":["Enrolled_on_Prev_COG_Study"],
+    "ON_STUDY_DX_CNS":["Tumor_Grade", "Tumor_M_Stage", "Cerebrospinal_Fluid_Status", "Spine_at_diagnosis", "Had_Surgical_Resection", "Residual_Tumor"],
+    "NCI_MCI_FUP":["Has_Molecular_Reports", "Trial_Enrolled_Using_Results", "Therapy_Matched_By_Sequencing", "Dx_Refined_by_Testing"],
+    "FOLLOW_UP":["APEC14B1_Reporting_Period", "FollowUp_Obtained_for_Period", "Vital_status", "Frontline_Treatment_Received", "Disease_Status_Evaluated_During_Interval",
+        "Achieved_Complete_Remission", "Developed_First_Relapse_or_Progression", "Dx_New_Primary_or_MDS", "Patient_Reached_Tenth_Anniv", "Confirmed_Lost_to_FollowUp",
+        "Plans_To_Continue_Tracking_Outcome", "Withdrew_APEC14B1_Consent"],
+    "ON_STUDY_DX_SOFT_TISSUE_SARCOMA":["Procedure_Type"],
+    "TX_CHEMO_CNS":["Treated_but_not_Enrolled", "COG_Anti_Cancer_Treatment", "Non_COG_Anti_Cancer_Treatment", "Chemotherapy"],
+    "DEATH":["Primary_Cause_of_Death"],
+    "RADIATION_THERAPY":["Radiation_Therapy"],
+    "RLP_PROG_CNS":["Relapse_Status", "Relapse_Date", "Relapse_Site"],
+    "CNS_DIAGNOSIS_DETAIL":["CNS_Diagnosis_Category", "CNS_Integrated_Diagnosis"]
+}
+
+# Byte strings, one of which appears in every file of a given report type (see sort_jsons).
+# Files containing none of the signatures for the needed report types are skipped without being decoded.
+json_type_signatures = {
+    "cog":[b'"upi"'],
+    "tumor_normal":[b'tumor_normal'],
+    "archer_fusion":[b'archer_fusion'],
+    "methyl_igm":[b'meth', b'Meth', b'METH'],
+    "methyl_v11":[b'meth', b'Meth', b'METH'],
+    "methyl_v12":[b'meth', b'Meth', b'METH'],
+    "methyl_v11_raw":[b'Methylation'],
+    "methyl_v12_raw":[b'Methylation'],
+    "methyl_igm_raw":[b'Methylation']
+}
+
+# Fields which are standardized together (see standardize_variant_notation and standardize_methylation_class).
+# Each field's standardized value depends on the values of the whole pool, so a projection requesting any of them parses all of them.
+standardization_pools = {
+    "variant_notation":["TN_Germline_Path", "TN_Germline_LikelyPath", "TN_Germline_VUS", "TN_Somatic_Tier1", "TN_Somatic_Tier2", "TN_Somatic_Tier3"],
+    "methylation_class":["Methylation_Superfamily", "Methylation_Family", "Methylation_Class", "Methylation_Subclass"]
+}
+
+def resolve_field_projection(data_dict_table, fields:str=None, field_sets:str=None):
+    # Resolves comma-separated data dictionary terms and/or 'JSON Source' groups into a set of requested terms.
+    # Returns None if no projection was requested, in which case everything is parsed.
+    if fields is None and field_sets is None:
+        return None
+    terms = list(data_dict_table['Term'])
+    sources = list(data_dict_table['JSON Source'])
+    requested = set(["Sample"])
+    if fields is not None:
+        for i in fields.split(","):
+            term = i.strip()
+            if term not in terms:
+                raise ValueError(f"Unknown field {term}. Fields must match a Term in the data dictionary.")
+            requested.add(term)
+    if field_sets is not None:
+        for i in field_sets.split(","):
+            source = i.strip().lower()
+            matched = [terms[j] for j in range(len(terms)) if sources[j].lower() == source]
+            if len(matched) == 0:
+                raise ValueError(f"Unknown field set {i.strip()}. Valid field sets are: {', '.join(sorted(set(sources)))}.")
+            requested.update(matched)
+    return requested
+
+def get_parsed_fields(requested:set):
+    # Fields which must be parsed for a projection: the requested fields, plus the rest of any standardization pool they are in.
+    # The extra fields are dropped again once standardized.
+    if requested is None:
+        return None
+    parsed = set(requested)
+    for pool in standardization_pools.values():
+        if not parsed.isdisjoint(pool):
+            parsed.update(pool)
+    return parsed
+
+def get_needed_json_types(data_dict_table, requested:set):
+    # Works out which report types must be decoded to populate the requested fields.
+    if requested is None:
+        return None
+    needed = set()
+    for term, source in zip(data_dict_table['Term'], data_dict_table['JSON Source']):
+        if term in requested:
+            needed.update(source_json_types.get(source, []))
+    return needed
+
+def wants_fields(requested:set, prefixes:list):
+    # True if no projection was requested, or if any requested field starts with one of the given prefixes.
+    if requested is None:
+        return True
+    for i in requested:
+        for p in prefixes:
+            if i.startswith(p):
+                return True
+    return False
+
+def could_be_json_type(json_bytes:bytes, json_types:set):
+    # Cheap check on undecoded file contents. False only if the file cannot be any of the given report types.
+    for i in json_types:
+        for signature in json_type_signatures[i]:
+            if signature in json_bytes:
+                return True
+    return False
+
+## Partial JSON Extraction
+
+# Paths which the parsers read from report types that are only partly used, as tuples of object keys and array indexes.
+# Files of these types are not fully decoded. Only these values are extracted, into a document of the same shape.
+json_type_paths = {
+    "methyl_v11_raw":[("meta_data", "report_title"), ("family_data", 0), ("class_data", 0), ("mgmt_methylation_data", 0)],
+    "methyl_v12_raw":[("meta_data", "report_title")],
+    "methyl_igm_raw":[("meta_data", "report_title")]
+}
+
+json_token_pattern = None
+
+def get_json_token_patterns():
+    # Compiled once. Strings are matched whole, and container skipping jumps straight to the next bracket or quote.
+    import re
+    global json_token_pattern
+    if json_token_pattern is None:
+        json_token_pattern = {
+            "string":re.compile(rb'"(?:[^"\\]|\\.)*"', re.DOTALL),
+            "structural":re.compile(rb'[\[\]{}"]'),
+            "scalar":re.compile(rb'[^,\]}\s]*'),
+            "whitespace":re.compile(rb'\s*')
+        }
+    return json_token_pattern
+
+def skip_json_whitespace(buffer, pos:int):
+    return get_json_token_patterns()["whitespace"].match(buffer, pos).end()
+
+def skip_json_string(buffer, pos:int):
+    match = get_json_token_patterns()["string"].match(buffer, pos)
+    if match is None:
+        raise ValueError(f"Unterminated JSON string at {pos}")
+    return match.end()
+
+def skip_json_container(buffer, pos:int, depth:int=0):
+    # Returns the position just past the container which is depth levels deep at pos (0 when pos is at its opening bracket).
+    # Strings are skipped whole, and everything between brackets and quotes (numbers, true/false/null) is jumped over by the regex search.
+    patterns = get_json_token_patterns()
+    while True:
+        match = patterns["structural"].search(buffer, pos)
+        if match is None:
+            raise ValueError(f"Unterminated JSON container at {pos}")
+        token = match.group()
+        if token == b'"':
+            pos = skip_json_string(buffer, match.start())
+            continue
+        pos = match.end()
+        if token == b'{' or token == b'[':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+def skip_json_value(buffer, pos:int):
+    # Returns the position just past the value starting at pos, without decoding it.
+    patterns = get_json_token_patterns()
+    first = buffer[pos:pos+1]
+    if first == b'"':
+        return skip_json_string(buffer, pos)
+    if first == b'{' or first == b'[':
+        return skip_json_container(buffer, pos)
+    return patterns["scalar"].match(buffer, pos).end()
+
+def decode_json_slice(buffer, start:int, end:int):
+    return json.loads(buffer[start:end], object_pairs_hook=handle_duplicates)
+
+def decode_json_key(buffer, start:int, end:int):
+    # Keys without escapes, i.e. nearly all of them, are decoded directly.
+    key_bytes = buffer[start+1:end-1]
+    if b'\\' in key_bytes:
+        return decode_json_slice(buffer, start, end)
+    return key_bytes.decode("utf-8")
+
+def extract_json_value(buffer, pos:int, paths:list, found:list, stop_keys:tuple=()):
+    # Extracts the values at paths (relative to the value starting at pos) and returns (extracted value, end position).
+    # found is a one-item counter of paths still to find. Once it reaches 0, scanning stops and the end position is None.
+    # Once this value's own paths are found, the rest of it is skipped in one go.
+    # If the value is an object with one of stop_keys before all paths are found, (None, None) is returned.
+    if () in paths:
+        end = skip_json_value(buffer, pos)
+        found[0] -= 1
+        return decode_json_slice(buffer, pos, end), end
+    first = buffer[pos:pos+1]
+    if first != b'{' and first != b'[':
+        # A scalar where an object or array was expected, so the paths are not present.
+        return None, skip_json_value(buffer, pos)
+    is_object = first == b'{'
+    out_value = {} if is_object else []
+    found_here = 0
+    index = 0
+    pos = skip_json_whitespace(buffer, pos + 1)
+    while buffer[pos:pos+1] != (b'}' if is_object else b']'):
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON container")
+        if is_object:
+            key_end = skip_json_value(buffer, pos)
+            key = decode_json_key(buffer, pos, key_end)
+            if key in stop_keys:
+                return None, None
+            pos = skip_json_whitespace(buffer, skip_json_whitespace(buffer, key_end) + 1) # Past the ':'
+        else:
+            key = index
+        # Of duplicated keys, the first keeps its name when fully decoded, so it is the one extracted.
+        sub_paths = [i[1:] for i in paths if i[0] == key] if not (is_object and key in out_value) else []
+        if len(sub_paths) > 0:
+            remaining = found[0]
+            value, pos = extract_json_value(buffer, pos, sub_paths, found)
+            if is_object:
+                out_value[key] = value
+            else:
+                # Skipped items before this one are left as None, so extracted items keep their indexes.
+                out_value.extend([None] * (index - len(out_value)))
+                out_value.append(value)
+            if found[0] == 0:
+                return out_value, None
+            found_here += remaining - found[0]
+            if found_here == len(paths):
+                return out_value, skip_json_container(buffer, pos, 1)
+        else:
+            pos = skip_json_value(buffer, pos)
+        pos = skip_json_whitespace(buffer, pos)
+        if buffer[pos:pos+1] == b',':
+            pos = skip_json_whitespace(buffer, pos + 1)
+        index += 1
+    return out_value, pos + 1
+
+def extract_json_paths(buffer, paths:list, stop_keys:tuple=()):
+    # Extracts only the given paths from an undecoded JSON document (bytes or mmap), e.g. [("meta_data", "report_title"), ("family_data", 0)].
+    # Returns a document of the same shape holding just those values, so parsers can read it like the fully decoded one.
+    # Everything else is skipped without being decoded, and scanning stops once all paths are found.
+    # Returns None if a top-level key in stop_keys comes before all paths are found.
+    # Missing paths are left out. Unlike a full decode, malformed JSON after the last extracted value is not detected.
+    found = [len(paths)]
+    pos = skip_json_whitespace(buffer, 0)
+    if buffer[pos:pos+1] != b'{':
+        raise ValueError("Expecting a JSON object")
+    out_value, end = extract_json_value(buffer, pos, paths, found, stop_keys)
+    return out_value
+
+# Raw methylation files are recognized by their report title, which comes first in the files seen so far.
+# Larger files are only memory-mapped and extracted if the title is within this many bytes of the start (see read_file_bytes).
+raw_methylation_head_bytes = 64*1024
+
+def could_be_raw_methylation(json_bytes):
+    # Cheap check before extraction. find stops at the first match, i.e. at the report title of raw methylation files.
+    return json_bytes.find(b'Methylation') != -1
+
+def get_raw_methylation_type(report_title:str):
+    if "v12" in report_title:
+        return "methyl_v12_raw"
+    elif "IGM" in report_title:
+        return "methyl_igm_raw"
+    return "methyl_v11_raw"
+
+def extract_raw_methylation(json_bytes):
+    # Extracts the report title first, then the paths its raw methylation type needs.
+    # Returns None if the file is not raw methylation data after all, so that it is fully decoded as before.
+    # Reports and COG files are told apart by their top-level subject_id and upi keys, which end the scan if they come first.
+    # (A report with its subject_id after a Methylation report title would be taken for raw data. No such report is known.)
+    stop_keys = ("subject_id", "upi")
+    title_doc = extract_json_paths(json_bytes, [("meta_data", "report_title")], stop_keys)
+    if title_doc is None or type(title_doc.get("meta_data")) is not dict:
+        return None
+    report_title = title_doc["meta_data"].get("report_title")
+    if type(report_title) is not str or "Methylation" not in report_title:
+        return None
+    json_type = get_raw_methylation_type(report_title)
+    if len(json_type_paths[json_type]) == 1:
+        return title_doc
+    return extract_json_paths(json_bytes, json_type_paths[json_type], stop_keys)
+
+## Error Reporting and Checkpoints
+
+def record_error(errors:list, stage:str, error:Exception, file:str=None, subject=None, json_type:str=None):
+    # Adds a structured record of a failed file or report to the run's error report.
+    if errors is None:
+        return
+    errors.append({"stage":stage, "file":file, "subject":None if subject is None else str(subject), "json_type":json_type,
+                   "error_type":type(error).__name__, "message":str(error)})
+
+def load_checkpoint(checkpoint_path:str, run_signature:dict, completed_errors:dict=None):
+    # Returns the rows completed by a previous, interrupted run, keyed by subject in the order they were completed.
+    # A checkpoint written for different inputs or options is ignored.
+    # A subject's error records are written just before its row, and are added to completed_errors (keyed by subject) once the row is read.
+    completed = {}
+    subject_errors = None
+    if not os.path.exists(checkpoint_path):
+        return completed
+    with open(checkpoint_path, 'r') as checkpoint_file:
+        header = None
+        for line in checkpoint_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line is incomplete if the run was killed while writing it.
+                break
+            if header is None:
+                header = record
+                if header != {"checkpoint":run_signature}:
+                    print(f"Checkpoint {checkpoint_path} was written with different inputs or options. Starting over.")
+                    return {}
+                continue
+            if "subject_errors" in record:
+                subject_errors = record["subject_errors"]
+                continue
+            completed[record['Sample']] = record
+            if subject_errors is not None and completed_errors is not None:
+                completed_errors[record['Sample']] = subject_errors
+            subject_errors = None
+    return completed
+
+def start_checkpoint(checkpoint_path:str, run_signature:dict, completed_rows:list, completed_errors:dict=None):
+    # (Re)writes the checkpoint with any rows already completed, and their error records, then returns it open for appending.
+    def write(tmp_path):
+        with open(tmp_path, 'w') as checkpoint_file:
+            checkpoint_file.write(json.dumps({"checkpoint":run_signature}) + "\n")
+            for row in completed_rows:
+                if completed_errors is not None and row['Sample'] in completed_errors:
+                    checkpoint_file.write(json.dumps({"subject_errors":completed_errors[row['Sample']]}) + "\n")
+                checkpoint_file.write(json.dumps(row) + "\n")
+    write_atomically(checkpoint_path, write)
+    return open(checkpoint_path, 'a')
+
+def append_checkpoint(checkpoint_file, rows:list):
+    for row in rows:
+        checkpoint_file.write(json.dumps(row) + "\n")
+    checkpoint_file.flush()
+    os.fsync(checkpoint_file.fileno())
+
 ## Prep Methods
 
 def get_dir_jsons(target_dir:str, log:bool=False):
@@ -58,9 +403,278 @@ def get_dir_jsons(target_dir:str, log:bool=False):
 
     return jsons
 
-def sort_jsons(json_dir_list:list, log:bool = False):
+def iter_dir_jsons(json_dir_list:list, file_index:dict=None, log:bool=False):
+    # Lazily globs each directory, so later directories are discovered while earlier files are still being read and parsed.
+    # If an index is given, each directory's listing and mtime are recorded so that --subjects runs can skip re-globbing it.
+    for dir in json_dir_list:
+        dir_mtime = None
+        if file_index is not None and not glob.has_magic(dir):
+            try:
+                dir_mtime = os.stat(dir).st_mtime
+            except OSError:
+                pass
+        dir_jsons = get_dir_jsons(dir, log)
+        if dir_mtime is not None:
+            file_index["dirs"][dir] = {"mtime":dir_mtime, "files":dir_jsons}
+        for j in dir_jsons:
+            yield j
+
+## Subject File Index
+
+def load_file_index(index_path:str):
+    # Loads the persistent subject/file index written by previous runs, or starts a new one.
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as index_file:
+            file_index = json.load(index_file)
+        if file_index.get("version") == 1:
+            return file_index
+        print(f"Index {index_path} has an unknown version. Rebuilding it.")
+    return {"version":1, "dirs":{}, "files":{}}
+
+def write_file_index(file_index:dict, index_path:str):
+    def write(tmp_path):
+        with open(tmp_path, 'w') as index_file:
+            index_file.write(json.dumps(file_index))
+    write_atomically(index_path, write)
+
+def indexed_file_changed(file_path:str, entry:dict):
+    # Files which failed to read or decode are indexed with no subject, and only re-read by --subjects runs once they change.
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return True
+    return file_stat.st_size != entry["size"] or file_stat.st_mtime != entry["mtime"]
+
+def get_subject_jsons(json_dir_list:list, file_index:dict, subjects:set, log:bool=False, dir_listings:dict=None):
+    # Uses the index to list only the given subjects' files.
+    # Directories modified since they were indexed are re-globbed, and files missing from the index are included so they get classified.
+    # The new listings are added to dir_listings, to be recorded in the index once their files are all classified (see sort_jsons).
+    json_list = []
+    for dir in json_dir_list:
+        listing = file_index["dirs"].get(dir)
+        unchanged = False
+        if listing is not None:
+            try:
+                unchanged = os.stat(dir).st_mtime == listing["mtime"]
+            except OSError:
+                pass
+        if unchanged:
+            dir_jsons = listing["files"]
+        else:
+            dir_mtime = None
+            if not glob.has_magic(dir):
+                try:
+                    dir_mtime = os.stat(dir).st_mtime
+                except OSError:
+                    pass
+            dir_jsons = get_dir_jsons(dir, log)
+            if dir_mtime is not None and dir_listings is not None:
+                dir_listings[dir] = {"mtime":dir_mtime, "files":dir_jsons}
+            if not glob.has_magic(dir):
+                # Drop entries for files which have been removed from the directory since it was indexed.
+                index_dir = os.path.dirname(os.path.join(dir, "*.json"))
+                current = set(dir_jsons)
+                for j in [k for k in file_index["files"] if os.path.dirname(k) == index_dir and k not in current]:
+                    del file_index["files"][j]
+        for j in dir_jsons:
+            entry = file_index["files"].get(j)
+            if entry is None or str(entry["subject"]) in subjects or (entry.get("error") and indexed_file_changed(j, entry)):
+                json_list.append(j)
+    if log:
+        print(f"Index lookup selected {len(json_list)} files for {len(subjects)} subjects.")
+    return json_list
+
+def parse_subject_list(subjects:str):
+    # Subjects may be given as a comma-separated list, or as a file with one subject per line.
+    if subjects is None:
+        return None
+    if os.path.isfile(subjects):
+        with open(subjects, 'r') as subject_file:
+            subject_list = [i.strip() for i in subject_file]
+    else:
+        subject_list = [i.strip() for i in subjects.split(",")]
+    return set([i for i in subject_list if len(i) > 0 and not i.startswith("#")])
+
+def skip_indexed_subjects(file_paths, file_index:dict, skip_subjects:set, indexed_files:dict):
+    # Passes through only files not already indexed to one of skip_subjects. Index entries of skipped files are carried over unchanged.
+    for i in file_paths:
+        entry = file_index["files"].get(i)
+        if entry is not None and str(entry["subject"]) in skip_subjects:
+            indexed_files[i] = entry
+        else:
+            yield i
+
+# Raw methylation files at least this large are memory-mapped and partly extracted instead of read, so only the pages scanned are read.
+mmap_min_bytes = 4*1024*1024
+
+def read_raw_methylation(in_file, file_size:int, file_mtime:float):
+    # Memory-maps a large file whose head looks like raw methylation data and extracts it here, in the reading thread,
+    # so that its page faults overlap with parsing like any other read. Returns None if it has to be read and decoded in full.
+    import mmap
+    extract_start = time.perf_counter()
+    try:
+        mapped = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # Some file systems cannot be mapped, e.g. FUSE mounts with direct I/O.
+        return None
+    try:
+        extracted = extract_raw_methylation(mapped)
+    except ValueError:
+        # Malformed JSON is left to the full decode, which reports it.
+        extracted = None
+    finally:
+        mapped.close()
+    if extracted is None:
+        return None
+    return ExtractedReport(file_size, file_mtime, extracted, time.perf_counter() - extract_start)
+
+def read_file_bytes(file_path:str, report_cache=None):
+    # Returns the file's contents and modification time. fstat on the open handle avoids a second path lookup.
+    # With a report_cache, an unchanged file that is already cached is not read, and its CachedReport is returned instead of the contents.
+    # Large raw methylation files are returned as an ExtractedReport instead of the contents (see read_raw_methylation).
+    if report_cache is not None:
+        file_stat = os.stat(file_path)
+        cached = report_cache.get(file_path, file_stat.st_size, file_stat.st_mtime)
+        if cached is not None:
+            return cached, file_stat.st_mtime
+    with open(file_path, 'rb') as in_file:
+        file_stat = os.fstat(in_file.fileno())
+        if file_stat.st_size >= mmap_min_bytes:
+            head = in_file.read(raw_methylation_head_bytes)
+            if could_be_raw_methylation(head):
+                extracted = read_raw_methylation(in_file, file_stat.st_size, file_stat.st_mtime)
+                if extracted is not None:
+                    return extracted, file_stat.st_mtime
+                in_file.seek(len(head))
+            return head + in_file.read(), file_stat.st_mtime
+        return in_file.read(), file_stat.st_mtime
+
+def estimate_decoded_bytes(json_data):
+    # Estimates the memory held by a decoded JSON document, by summing sys.getsizeof over all its containers, keys and values.
+    # Strings shared between objects are counted each time, so this errs on the high side.
+    total = 0
+    stack = [json_data]
+    while len(stack) > 0:
+        value = stack.pop()
+        total += sys.getsizeof(value)
+        if type(value) is dict:
+            for k, v in value.items():
+                total += sys.getsizeof(k)
+                stack.append(v)
+        elif type(value) is list:
+            stack.extend(value)
+    return total
+
+class CachedReport:
+    # A decoded report JSON, with the size of the file it was decoded from and an estimate of the memory it holds.
+    __slots__ = ("size", "mtime", "json_data", "decoded_bytes")
+
+    def __init__(self, size:int, mtime:float, json_data, decoded_bytes:int=0):
+        self.size = size
+        self.mtime = mtime
+        self.json_data = json_data
+        self.decoded_bytes = decoded_bytes
+
+class ExtractedReport(CachedReport):
+    # A partly extracted raw methylation JSON (see read_raw_methylation). Unlike a CachedReport, it is new to the report cache.
+    # extract_seconds is the time the reading thread spent mapping and extracting it, which --profile counts as its decode time.
+    __slots__ = ("extract_seconds",)
+
+    def __init__(self, size:int, mtime:float, json_data, extract_seconds:float):
+        super().__init__(size, mtime, json_data)
+        self.extract_seconds = extract_seconds
+
+class ReportCache:
+    # Least-recently-used cache of decoded report JSONs, shared by the jobs of a batch so files used by several cohorts are decoded once.
+    # Entries are keyed by path and only reused while the file's size and modification time are unchanged.
+    # The size bound is counted in estimated memory of the decoded JSONs (see estimate_decoded_bytes), not file bytes,
+    # as decoded reports take several times their file size, and partly extracted raw methylation files far less.
+    # Parsers only read the decoded JSONs, so the same objects can be handed to every job.
+    def __init__(self, max_bytes:int):
+        import threading
+        from collections import OrderedDict
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path:str, size:int, mtime:float):
+        with self.lock:
+            cached = self.entries.get(path)
+            if cached is None or cached.size != size or cached.mtime != mtime:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return cached
+
+    def put(self, path:str, size:int, mtime:float, json_data):
+        decoded_bytes = estimate_decoded_bytes(json_data)
+        if decoded_bytes > self.max_bytes:
+            return
+        with self.lock:
+            if path in self.entries:
+                self.bytes -= self.entries.pop(path).decoded_bytes
+            self.entries[path] = CachedReport(size, mtime, json_data, decoded_bytes)
+            self.bytes += decoded_bytes
+            while self.bytes > self.max_bytes:
+                path, cached = self.entries.popitem(last=False)
+                self.bytes -= cached.decoded_bytes
+
+def prefetch_files(file_paths, max_in_flight:int=8, max_buffered_bytes:int=512*1024*1024, report_cache=None):
+    # Reads files concurrently in a thread pool and yields (path, (bytes, mtime) or OSError) in the original order.
+    # Files found in report_cache yield (path, (CachedReport, mtime)) instead.
+    # High-latency storage (FUSE mounts, NFS) spends most of its time waiting on opens and reads, so several are kept in flight.
+    # New reads are not started while the finished-but-unconsumed buffers exceed the byte budget.
+    # file_paths can be a lazy iterable, so discovery of later directories overlaps with reading and parsing of earlier ones.
+    from concurrent.futures import ThreadPoolExecutor
+    from collections import deque
+
+    if max_in_flight <= 0:
+        for i in file_paths:
+            try:
+                yield i, read_file_bytes(i, report_cache)
+            except OSError as e:
+                yield i, e
+        return
+
+    path_iter = iter(file_paths)
+    in_flight = deque()
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while True:
+            while not exhausted and len(in_flight) < max_in_flight:
+                buffered = sum([len(f.result()[0]) for p, f in in_flight if f.done() and f.exception() is None and type(f.result()[0]) is bytes])
+                if len(in_flight) > 0 and buffered >= max_buffered_bytes:
+                    break
+                next_path = next(path_iter, None)
+                if next_path is None:
+                    exhausted = True
+                    break
+                in_flight.append((next_path, executor.submit(read_file_bytes, next_path, report_cache)))
+            if len(in_flight) == 0:
+                break
+            file_path, future = in_flight.popleft()
+            try:
+                yield file_path, future.result()
+            except OSError as e:
+                yield file_path, e
+
+def sort_jsons(json_dir_list:list, log:bool = False, max_in_flight:int = 8, max_buffered_bytes:int = 512*1024*1024, json_types:set = None,
+               file_index:dict = None, subjects:set = None, skip_subjects:set = None, errors:list = None, report_cache = None,
+               file_costs:list = None):
     # Restructures JSONs into a dictionary keyed by samples.
     # Values are copies of the 'blank dict' below, which is populated with JSON data.
+    # If json_types is given, only those report types are kept, and files which cannot be one of them are never decoded.
+    # If file_index is given, it is updated with the subject and report type of every file read.
+    # If subjects is given, only those subjects are kept, and with a file_index only their files (plus any not yet indexed) are read.
+    # Subjects in skip_subjects are dropped, and with a file_index their files are not read at all.
+    # Unreadable or malformed files are reported and added to errors, and the remaining files are still processed.
+    # If report_cache is given, decoded files are reused from it and added to it.
+    # If file_costs is given, the size and decode time of every decoded file is appended to it.
     blank_dict = {"cog":None, "tumor_normal":None,  "methyl_igm":None, "methyl_v11":None, "methyl_v12":None, "archer_fusion":None, "methyl_v11_raw":None, "methyl_v12_raw":None, "methyl_igm_raw":None}
     json_dicts = {}
 
@@ -68,17 +682,56 @@ def sort_jsons(json_dir_list:list, log:bool = False):
     
     json_sizes = {}
 
-    json_list = []
-    for dir in json_dir_list:
-        #print(dir)
-        json_list.extend(get_dir_jsons(dir))
-
-    for i in json_list:
+    dir_listings = {}
+    if file_index is not None and subjects is not None:
+        json_list = get_subject_jsons(json_dir_list, file_index, subjects, log, dir_listings)
+    else:
+        # Directory listings are only trusted by later --subjects runs if every file in them gets indexed, i.e. nothing is skipped by projection.
+        json_list = iter_dir_jsons(json_dir_list, file_index if json_types is None else None)
+    listed_jsons = json_list
+    indexed_files = {}
+    if file_index is not None and skip_subjects is not None:
+        json_list = skip_indexed_subjects(json_list, file_index, skip_subjects, indexed_files)
+
+    for i, read_result in prefetch_files(json_list, max_in_flight, max_buffered_bytes, report_cache):
         json_type = None
+        subject = None
+        json_size = None
 
         try:
-            with open(i, 'r') as json_file:
-                json_data = json.load(json_file, object_pairs_hook=handle_duplicates)
+            if isinstance(read_result, OSError):
+                raise read_result
+            json_bytes, json_mtime = read_result
+            decode_start = time.perf_counter()
+            extract_seconds = 0
+            if isinstance(json_bytes, CachedReport):
+                json_size = json_bytes.size
+                json_data = json_bytes.json_data
+                if type(json_bytes) is ExtractedReport:
+                    extract_seconds = json_bytes.extract_seconds
+                    if report_cache is not None:
+                        report_cache.put(i, json_size, json_mtime, json_data)
+            elif json_types is not None and not could_be_json_type(json_bytes, json_types):
+                if log:
+                    print(f"Skipping {i}, not a requested report type...")
+                if file_index is not None and i in file_index["files"]:
+                    prev_entry = file_index["files"][i]
+                    if prev_entry["size"] == len(json_bytes) and prev_entry["mtime"] == json_mtime:
+                        indexed_files[i] = prev_entry
+                continue
+            else:
+                json_size = len(json_bytes)
+                json_data = None
+                if could_be_raw_methylation(json_bytes):
+                    # Raw methylation data is mostly beta values which no parser reads, so only the needed paths are extracted.
+                    json_data = extract_raw_methylation(json_bytes)
+                if json_data is None:
+                    json_data = json.loads(json_bytes, object_pairs_hook=handle_duplicates)
+                if report_cache is not None:
+                    report_cache.put(i, json_size, json_mtime, json_data)
+            file_cost = {"file":i, "subject":None, "json_type":None, "bytes":json_size, "decode_seconds":time.perf_counter() - decode_start + extract_seconds}
+            if file_costs is not None:
+                file_costs.append(file_cost)
             if 'subject_id' in json_data:
                 subject = json_data['subject_id']
                 report_type = json_data['report_type']
@@ -104,15 +757,26 @@ def sort_jsons(json_dir_list:list, log:bool = False):
             elif 'meta_data' in json_data and 'report_title' in json_data['meta_data'] and "Methylation" in json_data['meta_data']['report_title']:
                 # Methylation data
                 subject = os.path.basename(i).replace("-","_").split("_")[1]
-                if "v12" in json_data['meta_data']['report_title']:
-                    json_type = "methyl_v12_raw"
-                elif "IGM" in json_data['meta_data']['report_title']:
-                    json_type = "methyl_igm_raw"
-                else:
-                    json_type = "methyl_v11_raw"
+                json_type = get_raw_methylation_type(json_data['meta_data']['report_title'])
             else:
                 if log:
                     print(f"Skipping {i}...")
+                indexed_files[i] = {"subject":None, "json_type":None, "size":json_size, "mtime":json_mtime}
+                continue
+
+            indexed_files[i] = {"subject":subject if json_type is not None else None, "json_type":json_type, "size":json_size, "mtime":json_mtime}
+            file_cost["subject"] = indexed_files[i]["subject"]
+            file_cost["json_type"] = json_type
+
+            if subjects is not None and str(subject) not in subjects:
+                continue
+
+            if skip_subjects is not None and str(subject) in skip_subjects:
+                continue
+
+            if json_types is not None and json_type not in json_types:
+                if log:
+                    print(f"Skipping {i} ({json_type}), not a requested report type...")
                 continue
 
             if json_type is not None and json_type in blank_dict:
@@ -121,7 +785,6 @@ def sort_jsons(json_dir_list:list, log:bool = False):
                 if subject not in json_dicts:
                     json_dicts[subject] = copy.copy(blank_dict)
                     json_sizes[subject]={}
-                json_size = os.path.getsize(i)
                 if json_dicts[subject][json_type] is not None:
                     if json_size == json_sizes[subject][json_type]:
                         if log:
@@ -140,9 +803,281 @@ def sort_jsons(json_dir_list:list, log:bool = False):
                 json_dicts[subject][json_type]=json_data
         except OSError as e:
             print(f"ERROR: {str(e)}. File {i}'s data will be missing from outputs.")
+            record_error(errors, "read", e, file=i, subject=subject, json_type=json_type)
+            try:
+                file_stat = os.stat(i)
+                indexed_files[i] = {"subject":None, "json_type":None, "size":file_stat.st_size, "mtime":file_stat.st_mtime, "error":True}
+            except OSError:
+                pass
+        except (ValueError, KeyError, TypeError, AttributeError, IndexError) as e:
+            # Malformed JSON, or JSON missing the fields used to identify it.
+            print(f"ERROR: Could not read {i} ({type(e).__name__}: {str(e)}). File {i}'s data will be missing from outputs.")
+            record_error(errors, "read", e, file=i, subject=subject, json_type=json_type)
+            if json_size is not None:
+                indexed_files[i] = {"subject":None, "json_type":None, "size":json_size, "mtime":json_mtime, "error":True}
+
+    if file_index is not None:
+        if subjects is None:
+            # A full run has seen every file, so entries for files which have since gone are dropped.
+            file_index["files"] = indexed_files
+        else:
+            for i in listed_jsons:
+                if i not in indexed_files:
+                    file_index["files"].pop(i, None)
+            file_index["files"].update(indexed_files)
+            # Re-globbed directories are trusted by later --subjects runs once every file in them is indexed.
+            for i in dir_listings:
+                if all([j in file_index["files"] for j in dir_listings[i]["files"]]):
+                    file_index["dirs"][i] = dir_listings[i]
 
     return json_dicts
 
+# Row Store
+
+# Marks data dictionary columns which a subject's record has not set.
+MISSING_VALUE = object()
+
+def intern_value(value):
+    # Interns strings, so values repeated across subjects (Positive/Negative, Male/Female, versions...) share a single object.
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+# Multi-valued fields (follow-ups, variants, CNV genes, fusions) are kept as lists while parsing and standardizing,
+# and only joined into ';'-separated strings once, when the row store is written out.
+
+def join_values(values:list, separator:str=";"):
+    # A single value is kept as-is, the same as a field that was only set once.
+    if len(values) == 1:
+        return values[0]
+    return separator.join([i if type(i) is str else f"{i}" for i in values])
+
+def split_values(value, separator:str=";"):
+    # Lists are returned as-is. Strings are split, e.g. values reloaded from an older checkpoint.
+    if type(value) is list:
+        return value
+    return value.split(separator)
+
+def joined_length(value, separator:str=";"):
+    # Length of the value once joined, without joining it.
+    if type(value) is list:
+        if len(value) == 0:
+            return 0
+        return sum([len(i) for i in value]) + len(separator) * (len(value) - 1)
+    return len(value)
+
+def get_low_cardinality_columns(data_dict_table):
+    # Terms marked in the data dictionary's optional 'Low Cardinality' column.
+    # Their values are interned while parsing and stored as categoricals in DataFrame outputs.
+    if 'Low Cardinality' not in data_dict_table.columns:
+        return set()
+    low_cardinality = set()
+    for term, flag in zip(data_dict_table['Term'], data_dict_table['Low Cardinality']):
+        if f"{flag}".strip().lower() in ["yes", "y", "true"]:
+            low_cardinality.add(term)
+    return low_cardinality
+
+class SubjectRecord:
+    # A single subject's row while it is being parsed. Supports the dict operations the parsers use.
+    # Data dictionary columns are held in a fixed list in column order. Any other keys go to extras.
+    __slots__ = ("column_index", "values", "extras")
+
+    def __init__(self, column_index:dict):
+        self.column_index = column_index
+        self.values = [MISSING_VALUE] * len(column_index)
+        self.extras = None
+
+    def __contains__(self, key):
+        i = self.column_index.get(key)
+        if i is None:
+            return self.extras is not None and key in self.extras
+        return self.values[i] is not MISSING_VALUE
+
+    def __getitem__(self, key):
+        i = self.column_index.get(key)
+        if i is None:
+            if self.extras is None:
+                raise KeyError(key)
+            return self.extras[key]
+        value = self.values[i]
+        if value is MISSING_VALUE:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        i = self.column_index.get(key)
+        if i is None:
+            if self.extras is None:
+                self.extras = {}
+            self.extras[key] = value
+        else:
+            self.values[i] = value
+
+    def __iter__(self):
+        for key, i in self.column_index.items():
+            if self.values[i] is not MISSING_VALUE:
+                yield key
+        if self.extras is not None:
+            for key in list(self.extras):
+                yield key
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def copy(self):
+        record = SubjectRecord(self.column_index)
+        record.values = list(self.values)
+        if self.extras is not None:
+            record.extras = dict(self.extras)
+        # Lists are copied too, so a parser that fails part-way through appending to them leaves the original row intact.
+        for i in range(len(record.values)):
+            if type(record.values[i]) is list:
+                record.values[i] = list(record.values[i])
+        return record
+
+class RowStore:
+    # Column-oriented store for the aggregated rows, with one preallocated numpy object array per data dictionary column.
+    # A presence mask tells columns a subject never set apart from ones set to None.
+    # Keys outside the data dictionary are kept per row in extras, unless keep_extras is False (e.g. for projections).
+    # Values of low_cardinality columns are interned as they are stored, and become categoricals in to_dataframe.
+    # Multi-valued fields are stored as lists until join_multi_values is called.
+    def __init__(self, columns:list, capacity:int, keep_extras:bool=True, low_cardinality:set=None):
+        import numpy as np
+        self.columns = list(columns)
+        self.column_index = {c:i for i, c in enumerate(self.columns)}
+        self.low_cardinality = set() if low_cardinality is None else set([c for c in low_cardinality if c in self.column_index])
+        self.interned = [c in self.low_cardinality for c in self.columns]
+        self.multi_valued = [False] * len(self.columns)
+        self.capacity = max(capacity, 1)
+        self.arrays = [np.full(self.capacity, None, dtype=object) for c in self.columns]
+        self.present = np.zeros((self.capacity, len(self.columns)), dtype=bool)
+        self.keep_extras = keep_extras
+        self.extras = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def new_record(self):
+        return SubjectRecord(self.column_index)
+
+    def grow(self):
+        import numpy as np
+        self.capacity = self.capacity * 2
+        for i in range(len(self.arrays)):
+            grown = np.full(self.capacity, None, dtype=object)
+            grown[:self.size] = self.arrays[i][:self.size]
+            self.arrays[i] = grown
+        grown_present = np.zeros((self.capacity, len(self.columns)), dtype=bool)
+        grown_present[:self.size] = self.present[:self.size]
+        self.present = grown_present
+
+    def append(self, row):
+        # Adds a SubjectRecord, or a plain dict such as a row reloaded from a checkpoint. Returns the new row number.
+        if self.size == self.capacity:
+            self.grow()
+        r = self.size
+        extras = None
+        if isinstance(row, SubjectRecord) and row.column_index is self.column_index:
+            for i, value in enumerate(row.values):
+                if value is not MISSING_VALUE:
+                    self.arrays[i][r] = intern_value(value) if self.interned[i] else value
+                    self.present[r, i] = True
+                    if type(value) is list:
+                        self.multi_valued[i] = True
+            extras = row.extras
+        else:
+            for key in row:
+                i = self.column_index.get(key)
+                if i is None:
+                    if extras is None:
+                        extras = {}
+                    extras[key] = row[key]
+                else:
+                    self.arrays[i][r] = intern_value(row[key]) if self.interned[i] else row[key]
+                    self.present[r, i] = True
+                    if type(row[key]) is list:
+                        self.multi_valued[i] = True
+        if extras is not None and self.keep_extras:
+            self.extras[r] = extras
+        self.size += 1
+        return r
+
+    def has(self, row:int, column:str):
+        return column in self.column_index and bool(self.present[row, self.column_index[column]])
+
+    def get(self, row:int, column:str, default=None):
+        if not self.has(row, column):
+            return default
+        return self.arrays[self.column_index[column]][row]
+
+    def set(self, row:int, column:str, value):
+        i = self.column_index[column]
+        self.arrays[i][row] = intern_value(value) if self.interned[i] else value
+        self.present[row, i] = True
+        if type(value) is list:
+            self.multi_valued[i] = True
+
+    def join_multi_values(self, separator:str=";"):
+        # Joins list values into strings, once, before the rows are written out. Only columns which were given a list are scanned.
+        for i in range(len(self.columns)):
+            if not self.multi_valued[i]:
+                continue
+            values = self.arrays[i]
+            for r in range(self.size):
+                if type(values[r]) is list:
+                    joined = join_values(values[r], separator)
+                    values[r] = intern_value(joined) if self.interned[i] else joined
+            self.multi_valued[i] = False
+        for r in self.extras:
+            for key in self.extras[r]:
+                if type(self.extras[r][key]) is list:
+                    self.extras[r][key] = join_values(self.extras[r][key], separator)
+
+    def drop_columns(self, columns:list):
+        # Removes columns, e.g. ones parsed only to standardize the requested fields of a projection.
+        keep = [i for i, c in enumerate(self.columns) if c not in columns]
+        self.columns = [self.columns[i] for i in keep]
+        self.column_index = {c:i for i, c in enumerate(self.columns)}
+        self.low_cardinality = set([c for c in self.low_cardinality if c in self.column_index])
+        self.interned = [self.interned[i] for i in keep]
+        self.multi_valued = [self.multi_valued[i] for i in keep]
+        self.arrays = [self.arrays[i] for i in keep]
+        self.present = self.present[:, keep]
+
+    def column(self, column:str):
+        # A view of the column's values. Rows where the column was never set hold None.
+        return self.arrays[self.column_index[column]][:self.size]
+
+    def column_present(self, column:str):
+        return self.present[:self.size, self.column_index[column]]
+
+    def row_values(self, row:int, columns:list):
+        return [self.get(row, i) for i in columns]
+
+    def row_dict(self, row:int):
+        out_dict = {}
+        for i, column in enumerate(self.columns):
+            if self.present[row, i]:
+                out_dict[column] = self.arrays[i][row]
+        if row in self.extras:
+            out_dict.update(self.extras[row])
+        return out_dict
+
+    def to_dataframe(self, categorical:bool=True):
+        # Builds the DataFrame directly on the column arrays (copy=False), instead of copying every row into it.
+        # Low-cardinality columns are encoded as categoricals, i.e. small integer codes plus one copy of each distinct value.
+        import pandas as pd
+        df_columns = {}
+        for i, c in enumerate(self.columns):
+            if categorical and self.interned[i]:
+                df_columns[c] = pd.Categorical(self.arrays[i][:self.size])
+            else:
+                df_columns[c] = self.arrays[i][:self.size]
+        return pd.DataFrame(df_columns, columns=self.columns, copy=False)
+
 # Clean-Up Methods
 
 def replace_blank_fields(data:dict, blank_field_placeholder:str = "."):
@@ -151,25 +1086,31 @@ def replace_blank_fields(data:dict, blank_field_placeholder:str = "."):
     for i in data:
         if type(data[i]) is str and data[i] == "":
             data[i] = blank_field_placeholder
+        elif type(data[i]) is list and (len(data[i]) == 0 or (len(data[i]) == 1 and data[i][0] == "")):
+            data[i] = blank_field_placeholder
     return data
 
-def standardize_variant_notation(data:dict,debug:bool=False,
-                                fields:list=["TN_Germline_Path","TN_Germline_LikelyPath","TN_Germline_VUS","TN_Somatic_Tier1","TN_Somatic_Tier2","TN_Somatic_Tier3"]
+def standardize_variant_notation(data:RowStore,debug:bool=False,
+                                fields:list=standardization_pools["variant_notation"]
                                 ):
     # Goes through and gets the longest-form version of each variant notation, and then expands all matching variants to conform to it
     if debug:
         print("\nSynonymizing variant notation for fields:\n\t")
         print("\n\t".join(fields))
 
+    # Columns are read straight from the row store
+    fields = [j for j in fields if j in data.column_index]
+    columns = [(j, data.column(j), data.column_present(j)) for j in fields]
+
     # Get all variants
     variants = set()
-    for i in data:
-        for j in fields:
-            if j in i:
-                if len(i[j]) <= 1:
+    for i in range(len(data)):
+        for j, values, present in columns:
+            if present[i]:
+                if joined_length(values[i]) <= 1:
                     pass
                 else:
-                    for v in i[j].split(";"):
+                    for v in split_values(values[i]):
                         variants.add(v)
     
     # Split into first three fields (A) and last field (B)
@@ -209,13 +1150,13 @@ def standardize_variant_notation(data:dict,debug:bool=False,
 
     # Apply updated data
     for i in range(len(data)):
-        for j in fields:
-            if j in data[i]:
-                if len(data[i][j]) <= 1:
+        for j, values, present in columns:
+            if present[i]:
+                if joined_length(values[i]) <= 1:
                     pass
                 else:
                     variants = []
-                    for v in data[i][j].split(";"):
+                    for v in split_values(values[i]):
                         var_str = " ".join(v.split(" ")[0:3])
                         update_A = convert_dict_A[var_str]
                         if (update_A) in convert_dict_A:
@@ -224,7 +1165,7 @@ def standardize_variant_notation(data:dict,debug:bool=False,
                         variants.append(update_B)
                         if (v != update_B and debug):
                             print(f"{v} -> {update_B}")
-                    data[i][j]=";".join(variants)
+                    data.set(i, j, variants)
 
     return data
 
@@ -236,8 +1177,8 @@ def methyl_to_ref(methyl_raw:str):
     methyl_ref = "".join(sorted(methyl_ref.lower().split("_")))
     return methyl_ref
 
-def standardize_methylation_class(data:dict,debug:bool=False,
-    fields:list=["Methylation_Superfamily","Methylation_Family","Methylation_Class","Methylation_Subclass"]
+def standardize_methylation_class(data:RowStore,debug:bool=False,
+    fields:list=standardization_pools["methylation_class"]
     ):
     # Goes through and determines a standard version of methylation class
     if debug:
@@ -246,20 +1187,19 @@ def standardize_methylation_class(data:dict,debug:bool=False,
 
     methyl_classes = {}
 
+    fields = [j for j in fields if j is not None and j != "" and j in data.column_index]
+    columns = [(j, data.column(j), data.column_present(j)) for j in fields]
+
     for i in range(len(data)):
-        if data[i] is None:
-            continue
-        for j in fields:
-            if j is None or j == "":
-                continue
-            if j in data[i]:
-                methyl_data = data[i][j][::-1].strip()[::-1].strip().replace("haem","hem").replace("Haem","Hem").replace("paed","ped").replace("Paed","ped").replace("_"," ")
+        for j, values, present in columns:
+            if present[i]:
+                methyl_data = values[i][::-1].strip()[::-1].strip().replace("haem","hem").replace("Haem","Hem").replace("paed","ped").replace("Paed","ped").replace("_"," ")
                 while len(methyl_data) > 0 and methyl_data[-1] in [".",",",";",":"," "]:
                     methyl_data = methyl_data[0:-1]
 
-                #print(f'{methyl_data} -> {data[i][j]}')
+                #print(f'{methyl_data} -> {values[i]}')
                 
-                data[i][j] = methyl_data
+                data.set(i, j, methyl_data)
 
                 methyl_ref = methyl_to_ref(methyl_data)
                 if methyl_ref not in methyl_classes:
@@ -280,17 +1220,15 @@ def standardize_methylation_class(data:dict,debug:bool=False,
                 methyl_convert[i]=j
 
     for i in range(len(data)):
-        if data[i] is None:
-            continue
-        for j in fields:
-            if j in data[i]:
-                new_methyl = methyl_convert[methyl_to_ref(data[i][j])]
+        for j, values, present in columns:
+            if present[i]:
+                new_methyl = methyl_convert[methyl_to_ref(values[i])]
                 if len(new_methyl) > 1:
                     new_methyl = new_methyl[0].upper() + new_methyl[1:]
-                if (data[i][j] != new_methyl):
+                if (values[i] != new_methyl):
                     if debug :
-                        print(f"{data[i][j]} -> {new_methyl}")
-                    data[i][j] = new_methyl
+                        print(f"{values[i]} -> {new_methyl}")
+                    data.set(i, j, new_methyl)
 
     return data
 
@@ -298,14 +1236,17 @@ def standardize_methylation_class(data:dict,debug:bool=False,
 
 ##COG JSON
 
-def parse_cog_json(cog_json, out_dict:dict={}):
+def parse_cog_json(cog_json, out_dict:dict={}, fields:set=None):
     # Takes in the sample JSONs dictionary and processes the COG JSON if it is present.
+    # If fields is given, forms which populate none of those fields are skipped.
     if cog_json is None:
         return out_dict
     forms_dict = {}
     follow_ups = []
     for i in cog_json['forms']:
         form_name = i['form_id']
+        if fields is not None and not wants_fields(fields, cog_form_fields.get(form_name, [])):
+            continue
         if form_name == "FOLLOW_UP":
             # Follow-up can have multiple forms, which all have key 'data' in the COG JSON.
             fup_keys = i.keys()
@@ -372,13 +1313,13 @@ def parse_cog_json(cog_json, out_dict:dict={}):
     # Follow-Up form
     if "FOLLOW_UP" in forms_dict:
         for fup_form in forms_dict["FOLLOW_UP"]:
-            append_string(fup_form["REP_EVAL_PD_TP"]["value"], "APEC14B1_Reporting_Period", out_dict)
+            append_value(fup_form["REP_EVAL_PD_TP"]["value"], "APEC14B1_Reporting_Period", out_dict)
             if fup_form["PT_INF_CU_FU_COL_IND"]["value"].lower() == "yes":
                 fup_obt = f"{fup_form["PT_INF_CU_FU_COL_IND"]["value"]} ({fup_form["PT_FU_BEGDT"]["value"]}-{fup_form["PT_FU_END_DT"]["value"]})"
             else:
                 fup_obt = fup_form["PT_INF_CU_FU_COL_IND"]["value"]
-            append_string(fup_obt, "FollowUp_Obtained_for_Period", out_dict)
-            append_string(fup_form["PT_VST"]["value"], "Vital_status", out_dict)
+            append_value(fup_obt, "FollowUp_Obtained_for_Period", out_dict)
+            append_value(fup_form["PT_VST"]["value"], "Vital_status", out_dict)
             frontline_treatments=";".join(get_frontline_treatments([fup_form["FSTLNTXINIDXADM"]["value"],
                 fup_form["FSTLNTXINIDXADMCAT_A1"]["value"],
                 fup_form["FSTLNTXINIDXADMCAT_A2"]["value"],
@@ -388,15 +1329,15 @@ def parse_cog_json(cog_json, out_dict:dict={}):
                 fup_form["FSTLNTXINIDXADMCAT_A6"]["value"],
                 fup_form["FSTLNTXINIDXADMOS"]["value"]]))
             if len(frontline_treatments) > 0 or "Frontline_Treatment_Received" not in out_dict:
-                append_string(frontline_treatments, "Frontline_Treatment_Received", out_dict)
-            append_string(fup_form["DZ_EXM_REP_IND_2"]["value"], "Disease_Status_Evaluated_During_Interval", out_dict)
-            append_string(fup_form["COMP_RESP_CONF_IND_3"]["value"],"Achieved_Complete_Remission", out_dict)
-            append_string(fup_form["DZ_REL_PROG_IND3"]["value"],"Developed_First_Relapse_or_Progression", out_dict)
-            append_string(fup_form["NEW_CA_DX_IND_3"]["value"], "Dx_New_Primary_or_MDS", out_dict)
-            append_string(fup_form["PT_FU_ANNIV_REACH_IND"]["value"], "Patient_Reached_Tenth_Anniv", out_dict)
-            append_string(fup_form["PT_LOST_FU_IND_2"]["value"], "Confirmed_Lost_to_FollowUp", out_dict)
-            append_string(fup_form["PT_FOL_CON_IND"]["value"], "Plans_To_Continue_Tracking_Outcome", out_dict)
-            append_string(fup_form["PTWDRWCSNTFUENDRPDIND"]["value"], "Withdrew_APEC14B1_Consent", out_dict)
+                append_value(frontline_treatments, "Frontline_Treatment_Received", out_dict)
+            append_value(fup_form["DZ_EXM_REP_IND_2"]["value"], "Disease_Status_Evaluated_During_Interval", out_dict)
+            append_value(fup_form["COMP_RESP_CONF_IND_3"]["value"],"Achieved_Complete_Remission", out_dict)
+            append_value(fup_form["DZ_REL_PROG_IND3"]["value"],"Developed_First_Relapse_or_Progression", out_dict)
+            append_value(fup_form["NEW_CA_DX_IND_3"]["value"], "Dx_New_Primary_or_MDS", out_dict)
+            append_value(fup_form["PT_FU_ANNIV_REACH_IND"]["value"], "Patient_Reached_Tenth_Anniv", out_dict)
+            append_value(fup_form["PT_LOST_FU_IND_2"]["value"], "Confirmed_Lost_to_FollowUp", out_dict)
+            append_value(fup_form["PT_FOL_CON_IND"]["value"], "Plans_To_Continue_Tracking_Outcome", out_dict)
+            append_value(fup_form["PTWDRWCSNTFUENDRPDIND"]["value"], "Withdrew_APEC14B1_Consent", out_dict)
     # On-study diagnosis (STS) form
     if "ON_STUDY_DX_SOFT_TISSUE_SARCOMA" in forms_dict:
         out_dict["Procedure_Type"]=forms_dict["ON_STUDY_DX_SOFT_TISSUE_SARCOMA"]["SURG_RESECT_EXT_TP"]["value"]
@@ -465,13 +1406,18 @@ def get_frontline_treatments(frontline_treatments:list):
         treatments_out = [frontline_treatments[0]]
     return treatments_out
 
-def append_string(new_data:str, data_key:str, data_dict:dict, separator:str=";", blank_field_indicator:str=""):
+def append_value(new_data:str, data_key:str, data_dict:dict, blank_field_indicator:str=""):
+    # Adds a value to a multi-valued field's list. The list is joined when the outputs are written.
     if new_data is None or new_data == "":
         new_data = blank_field_indicator
     if data_key in data_dict:
-        data_dict[data_key] = f"{data_dict[data_key]}{separator}{new_data}"
+        values = data_dict[data_key]
+        if type(values) is list:
+            values.append(new_data)
+        else:
+            data_dict[data_key] = [values, new_data]
     else:
-        data_dict[data_key] = new_data
+        data_dict[data_key] = [new_data]
 
 ## IGM Molecular
 
@@ -489,7 +1435,7 @@ def parse_molecular_generic(generic_json, out_dict:dict={}):
 
 ### Tumor-Normal Exome
 
-def parse_tumor_normal_json(tn_json, out_dict:dict={}):
+def parse_tumor_normal_json(tn_json, out_dict:dict={}, fields:set=None):
     if tn_json is None:
         return out_dict
     
@@ -513,7 +1459,7 @@ def parse_tumor_normal_json(tn_json, out_dict:dict={}):
                   'TN_Germline_CNV_Gene_LOH':[], 'TN_Somatic_CNV_Gene_LOH':[],
                   'TN_Germline_CNV_Blurb':"", 'TN_Somatic_CNV_Blurb':""
                   }
-    if 'somatic_results' in tn_json:
+    if 'somatic_results' in tn_json and wants_fields(fields, ['TN_Somatic_Result', 'TN_Somatic_Tier']):
         if 'variants' in tn_json['somatic_results']:
             for v in tn_json['somatic_results']['variants']:
                 var_str, tier = var_to_string(v)
@@ -525,7 +1471,7 @@ def parse_tumor_normal_json(tn_json, out_dict:dict={}):
                     variants['TN_Somatic_Tier3'].append(var_str)
                 if len(var_str) > 0:
                     out_dict['TN_Somatic_Result']='Positive'
-    if 'germline_results' in tn_json:
+    if 'germline_results' in tn_json and wants_fields(fields, ['TN_Germline_Result', 'TN_Germline_Path', 'TN_Germline_LikelyPath', 'TN_Germline_VUS']):
         if 'variants' in tn_json['germline_results']:
             for v in tn_json['germline_results']['variants']:
                 var_str, tier = var_to_string(v)
@@ -538,88 +1484,92 @@ def parse_tumor_normal_json(tn_json, out_dict:dict={}):
                 if len(var_str) > 0:
                     out_dict['TN_Germline_Result']='Positive'
 
-    if 'somatic_cnv_results' in tn_json:
-        if 'variants' in tn_json['somatic_cnv_results']:
-            for v in tn_json['somatic_cnv_results']['variants']:
-                var_str, tier = cnv_to_string(v)
-                if tier == '1' or 'tier' == '2':
-                    variants['TN_Somatic_CNV_Tier1-2'].append(var_str)
-                else:
-                    variants['TN_Somatic_CNV_Tier3'].append(var_str)
-                out_dict['TN_Somatic_CNV_Result']='Positive'
-                copy_type = v['copy_number_type'].lower()
-                if 'bialle' in copy_type or 'complet' in copy_type or 'total' in copy_type:
-                    gene_changes['TN_Somatic_CNV_Gene_BiallelicLoss'].extend(v['disease_associated_gene_content'])
-                elif 'loh' in copy_type or 'hetero' in copy_type or 'roh' in copy_type or 'homo' in copy_type:
-                    gene_changes['TN_Somatic_CNV_Gene_LOH'].extend(v['disease_associated_gene_content'])   
-                elif 'gain' in copy_type:
-                    gene_changes['TN_Somatic_CNV_Gene_Gain'].extend(v['disease_associated_gene_content'])
-                elif 'ampli' in copy_type:
-                    gene_changes['TN_Somatic_CNV_Gene_Amplification'].extend(v['disease_associated_gene_content'])
-                elif 'loss' in copy_type:
-                    gene_changes['TN_Somatic_CNV_Gene_Loss'].extend(v['disease_associated_gene_content'])
-                else:
-                    #print(f'{tn_json["subject_id"]} Invalid somatic CNV-LOH event type: {copy_type}')
-                    pass
-        if 'summary' in tn_json['somatic_cnv_results']:
-            gene_changes["TN_Somatic_CNV_Blurb"] = ("\n".join(tn_json['somatic_cnv_results']['summary']))
-            if out_dict['TN_Somatic_CNV_Result'] == 'Negative' and gene_changes["TN_Somatic_CNV_Blurb"] is not None:
-                bt = gene_changes["TN_Somatic_CNV_Blurb"].strip().lower()
-                if len(bt) > 0 and not any(["none detected" in bt, "not sufficient" in bt, "insufficient" in bt, "did not meet" in bt]):
-                    out_dict['TN_Somatic_CNV_Result']='Positive'
-
-    if 'germline_cnv_results' in tn_json:
-        if 'variants' in tn_json['germline_cnv_results']:
-            for v in tn_json['germline_cnv_results']['variants']:
-                var_str, tier = cnv_to_string(v)
-                if tier == '1' or 'tier' == '2':
-                    variants['TN_Germline_CNV_Tier1-2'].append(var_str)
-                else:
-                    variants['TN_Germline_CNV_Tier3'].append(var_str)
-                out_dict['TN_Germline_CNV_Result']='Positive'
-                copy_type = v['copy_number_type'].lower()
-                if 'bialle' in copy_type or 'complet' in copy_type or 'total' in copy_type:
-                    gene_changes['TN_Germline_CNV_Gene_BiallelicLoss'].extend(v['disease_associated_gene_content'])
-                elif 'loh' in copy_type or 'hetero' in copy_type or 'roh' in copy_type or 'homo' in copy_type:
-                    gene_changes['TN_Germline_CNV_Gene_LOH'].extend(v['disease_associated_gene_content'])   
-                elif 'gain' in copy_type:
-                    gene_changes['TN_Germline_CNV_Gene_Gain'].extend(v['disease_associated_gene_content'])
-                elif 'ampli' in copy_type:
-                    gene_changes['TN_Germline_CNV_Gene_Amplification'].extend(v['disease_associated_gene_content'])
-                elif 'loss' in copy_type or 'del' in copy_type:
-                    gene_changes['TN_Germline_CNV_Gene_Loss'].extend(v['disease_associated_gene_content'])
-                else:
-                    #print(f'{tn_json["subject_id"]} Invalid germline CNV-LOH event type: {copy_type}')
-                    pass
-        if 'summary' in tn_json['germline_cnv_results']:
-            gene_changes["TN_Germline_CNV_Blurb"] = ("\n".join(tn_json['germline_cnv_results']['summary']))
-            if out_dict['TN_Germline_CNV_Result'] == 'Negative' and gene_changes["TN_Germline_CNV_Blurb"] is not None:
-                bt = gene_changes["TN_Germline_CNV_Blurb"].strip().lower()
-                if len(bt) > 0 and not any(["none detected" in bt, "not sufficient" in bt, "insufficient" in bt, "did not meet" in bt]):
-                    out_dict['TN_Germline_CNV_Result']='Positive'
+    for origin in ["Somatic", "Germline"]:
+        if f'{origin.lower()}_cnv_results' in tn_json and wants_fields(fields, [f'TN_{origin}_CNV']):
+            parse_tn_cnv_results(tn_json[f'{origin.lower()}_cnv_results'], origin, variants, gene_changes, out_dict)
     
     for i in variants:
         #for j in range(len(variants[i])):
         #    variant = variants[i][j]
         #    if "(" in variant or ")" in variant:
         #        print(variant)
-        out_dict[i]=";".join(variants[i])
+        out_dict[i]=variants[i]
 
+    # Gene lists are already deduplicated and sorted by bucket_cnv_genes.
     for i in gene_changes:
-        if "Blurb" in i:
-            gene_string = gene_changes[i]
-        else:
-            gene_set = set(gene_changes[i])
-            gene_set.discard("N/A")
-            gene_set.discard("NA")
-            gene_set.discard("n/a")
-            gene_set.discard("")
-            gene_string = ";".join(sorted(list(gene_set)))
-        out_dict[i] = gene_string
+        out_dict[i] = gene_changes[i]
 
     out_dict = parse_molecular_generic(tn_json, out_dict)
     return out_dict
 
+def parse_tn_cnv_results(cnv_results:dict, origin:str, variants:dict, gene_changes:dict, out_dict:dict):
+    # Parses either the somatic or the germline CNV results (origin "Somatic" or "Germline") into the TN_<origin>_CNV_* fields.
+    if 'variants' in cnv_results:
+        for v in cnv_results['variants']:
+            var_str, tier = cnv_to_string(v)
+            # Tier 2 CNVs have always been listed with Tier 3 ones here, as the tier 2 check compared against the literal 'tier'.
+            # That is kept as-is so existing outputs do not change.
+            if tier == '1':
+                variants[f'TN_{origin}_CNV_Tier1-2'].append(var_str)
+            else:
+                variants[f'TN_{origin}_CNV_Tier3'].append(var_str)
+            out_dict[f'TN_{origin}_CNV_Result']='Positive'
+        for bucket, genes in bucket_cnv_genes(cnv_results['variants'], origin).items():
+            gene_changes[f'TN_{origin}_CNV_Gene_{bucket}'] = genes
+    if 'summary' in cnv_results:
+        gene_changes[f"TN_{origin}_CNV_Blurb"] = ("\n".join(cnv_results['summary']))
+        if out_dict[f'TN_{origin}_CNV_Result'] == 'Negative' and gene_changes[f"TN_{origin}_CNV_Blurb"] is not None:
+            bt = gene_changes[f"TN_{origin}_CNV_Blurb"].strip().lower()
+            if len(bt) > 0 and not any(["none detected" in bt, "not sufficient" in bt, "insufficient" in bt, "did not meet" in bt]):
+                out_dict[f'TN_{origin}_CNV_Result']='Positive'
+
+# Rules for the gene list a CNV's genes go to, checked in order against its lower-cased copy_number_type.
+# Note that "homozygous deletion" matches 'homo' and goes to LOH. Germline losses are also reported as deletions, which somatic ones are not matched on.
+cnv_bucket_rules = {
+    "Somatic":[(("bialle", "complet", "total"), "BiallelicLoss"), (("loh", "hetero", "roh", "homo"), "LOH"),
+               (("gain",), "Gain"), (("ampli",), "Amplification"), (("loss",), "Loss")],
+    "Germline":[(("bialle", "complet", "total"), "BiallelicLoss"), (("loh", "hetero", "roh", "homo"), "LOH"),
+                (("gain",), "Gain"), (("ampli",), "Amplification"), (("loss", "del"), "Loss")]
+}
+
+# Bucket of each copy_number_type seen so far, per origin. Reports use a small set of distinct types, so each is only classified once.
+cnv_bucket_cache = {origin:{} for origin in cnv_bucket_rules}
+
+cnv_gene_placeholders = {"N/A", "NA", "n/a", ""}
+
+def classify_cnv_type(copy_number_type:str, origin:str):
+    # Returns the bucket (e.g. "Gain", "BiallelicLoss") for a copy_number_type, or None if no rule matches.
+    cache = cnv_bucket_cache[origin]
+    if copy_number_type not in cache:
+        copy_type = copy_number_type.lower()
+        bucket = None
+        for substrings, rule_bucket in cnv_bucket_rules[origin]:
+            if any([i in copy_type for i in substrings]):
+                bucket = rule_bucket
+                break
+        cache[copy_number_type] = bucket
+    return cache[copy_number_type]
+
+def bucket_cnv_genes(cnv_variants:list, origin:str):
+    # Groups the disease-associated genes of one report's CNVs by bucket. Each bucket's genes are deduplicated, sorted, and without N/A placeholders.
+    # The cache is read inline, as this runs for every CNV event. classify_cnv_type is only called for types not seen before.
+    cache = cnv_bucket_cache[origin]
+    buckets = {}
+    for v in cnv_variants:
+        copy_number_type = v['copy_number_type']
+        bucket = cache[copy_number_type] if copy_number_type in cache else classify_cnv_type(copy_number_type, origin)
+        if bucket is None:
+            continue
+        if bucket in buckets:
+            buckets[bucket].extend(v['disease_associated_gene_content'])
+        else:
+            buckets[bucket] = list(v['disease_associated_gene_content'])
+    return {bucket:sorted(set(genes).difference(cnv_gene_placeholders)) for bucket, genes in buckets.items()}
+
+def bucket_cnv_genes_batch(cnv_variant_lists:list, origin:str):
+    # Buckets many reports' CNV lists in one call, sharing the classification cache. Returns one bucket dictionary per list.
+    return [bucket_cnv_genes(i, origin) for i in cnv_variant_lists]
+
 def get_tier(tier_str:str):
     # Process various strings to tiering
     tier_str = tier_str.lower()
@@ -866,8 +1816,8 @@ def parse_archer_json(archer_json, out_dict:dict={}):
         results = []
         for i in archer_json['fusion_tier_one_or_two_result']['variants']:
             results.append(i['gene_fusion'])
-        out_dict['Archer_Tier1-2_Fusions']=";".join(results)
-        if len(out_dict['Archer_Tier1-2_Fusions']) > 0:
+        out_dict['Archer_Tier1-2_Fusions']=results
+        if joined_length(out_dict['Archer_Tier1-2_Fusions']) > 0:
             out_dict['Archer_Result_Tier1-2'] = 'Positive'
         if 'summary' in archer_json['fusion_tier_one_or_two_result']:
             out_dict['Archer_Blurb_Tier1-2'] = " ".join(archer_json['fusion_tier_one_or_two_result']['summary'])
@@ -875,8 +1825,8 @@ def parse_archer_json(archer_json, out_dict:dict={}):
         results = []
         for i in archer_json['single_tier_one_or_two_result']['variants']:
             results.append(i['breakpoint1']['gene'])
-        out_dict['Archer_Tier1-2_Intragenic']=";".join(results)
-        if len(out_dict['Archer_Tier1-2_Intragenic']) > 0:
+        out_dict['Archer_Tier1-2_Intragenic']=results
+        if joined_length(out_dict['Archer_Tier1-2_Intragenic']) > 0:
             out_dict['Archer_Result_Tier1-2'] = 'Positive'
         if 'summary' in archer_json['single_tier_one_or_two_result']:
             out_dict['Archer_Blurb_Tier1-2_Intragenic'] = " ".join(archer_json['single_tier_one_or_two_result']['summary'])
@@ -884,8 +1834,8 @@ def parse_archer_json(archer_json, out_dict:dict={}):
         results = []
         for i in archer_json['fusion_tier_three_result']['variants']:
             results.append(i['gene_fusion'])
-        out_dict['Archer_Tier3_Fusions']=";".join(results)
-        if len(out_dict['Archer_Tier3_Fusions']) > 0:
+        out_dict['Archer_Tier3_Fusions']=results
+        if joined_length(out_dict['Archer_Tier3_Fusions']) > 0:
             out_dict['Archer_Result_Tier3'] = 'Positive'
         if 'summary' in archer_json['fusion_tier_three_result']:
             out_dict['Archer_Blurb_Tier3'] = " ".join(archer_json['fusion_tier_three_result']['summary'])
@@ -893,8 +1843,8 @@ def parse_archer_json(archer_json, out_dict:dict={}):
         results = []
         for i in archer_json['single_tier_three_result']['variants']:
             results.append(i['breakpoint1']['gene'])
-        out_dict['Archer_Tier3_Intragenic']=";".join(results)
-        if len(out_dict['Archer_Tier3_Intragenic']) > 0:
+        out_dict['Archer_Tier3_Intragenic']=results
+        if joined_length(out_dict['Archer_Tier3_Intragenic']) > 0:
             out_dict['Archer_Result_Tier3'] = 'Positive'
         if 'summary' in archer_json['single_tier_three_result']:
             out_dict['Archer_Blurb_Tier3_Intragenic'] = " ".join(archer_json['single_tier_three_result']['summary'])
@@ -903,107 +1853,876 @@ def parse_archer_json(archer_json, out_dict:dict={}):
 
 # Passes samples through the above parsers in sequence
 
-def parse_sample_jsons(sample_jsons:dict):
-    out_dict = {}
+def parse_isolated(parse_function, out_dict:dict, errors:list=None, subject=None, json_type:str=None, timings:dict=None):
+    # Runs a single report's parser on a copy of the row, so that a malformed report only loses its own fields.
+    # Without an error list, exceptions are raised as before.
+    # If timings is given, the parser's run time is added to it under json_type.
+    if timings is not None:
+        start = time.perf_counter()
+        try:
+            return parse_isolated(parse_function, out_dict, errors, subject, json_type)
+        finally:
+            timings[json_type] = timings.get(json_type, 0) + time.perf_counter() - start
+    if errors is None:
+        return parse_function(out_dict)
+    try:
+        return parse_function(out_dict.copy())
+    except Exception as e:
+        print(f"ERROR: Could not parse {subject} {json_type} ({type(e).__name__}: {str(e)}). Its fields will be missing from outputs.")
+        record_error(errors, "parse", e, subject=subject, json_type=json_type)
+        return out_dict
+
+def parse_sample_jsons(sample_jsons:dict, fields:set=None, errors:list=None, subject=None, out_dict=None, timings:dict=None):
+    # out_dict can be a SubjectRecord from the run's RowStore. A plain dict is used otherwise.
+    # If timings is given, each report type's parse time is recorded in it.
+    if out_dict is None:
+        out_dict = {}
 
     if "cog" in sample_jsons:
-        out_dict = parse_cog_json(sample_jsons["cog"], out_dict)
+        out_dict = parse_isolated(lambda d: parse_cog_json(sample_jsons["cog"], d, fields), out_dict, errors, subject, "cog", timings)
     if "tumor_normal" in sample_jsons:
-        out_dict = parse_tumor_normal_json(sample_jsons["tumor_normal"], out_dict)
+        out_dict = parse_isolated(lambda d: parse_tumor_normal_json(sample_jsons["tumor_normal"], d, fields), out_dict, errors, subject, "tumor_normal", timings)
     if ("methyl_igm" in sample_jsons and sample_jsons["methyl_igm"] is not None) or ("methyl_v12" in sample_jsons and sample_jsons["methyl_v12"] is not None):
         if "methyl_igm" in sample_jsons and sample_jsons["methyl_igm"] is not None:
-            out_dict = parse_methyl_json(sample_jsons["methyl_igm"], "IGM", out_dict)
+            out_dict = parse_isolated(lambda d: parse_methyl_json(sample_jsons["methyl_igm"], "IGM", d), out_dict, errors, subject, "methyl_igm", timings)
         elif "methyl_v12" in sample_jsons and sample_jsons["methyl_v12"] is not None:
-            out_dict = parse_methyl_json(sample_jsons["methyl_v12"], "v12", out_dict)
+            out_dict = parse_isolated(lambda d: parse_methyl_json(sample_jsons["methyl_v12"], "v12", d), out_dict, errors, subject, "methyl_v12", timings)
     elif ("methyl_v11" in sample_jsons and sample_jsons["methyl_v11"] is not None) or ("methyl_v11_raw" in sample_jsons and sample_jsons["methyl_v11_raw"] is not None):
         if "methyl_v11_raw" in sample_jsons and sample_jsons["methyl_v11_raw"] is not None:
-            out_dict = parse_methyl_rawdata_json(sample_jsons["methyl_v11_raw"], True, out_dict)
+            out_dict = parse_isolated(lambda d: parse_methyl_rawdata_json(sample_jsons["methyl_v11_raw"], True, d), out_dict, errors, subject, "methyl_v11_raw", timings)
         if "methyl_v11" in sample_jsons and sample_jsons["methyl_v11"] is not None:
-            out_dict = parse_methyl_json(sample_jsons["methyl_v11"], "v11", out_dict)
+            out_dict = parse_isolated(lambda d: parse_methyl_json(sample_jsons["methyl_v11"], "v11", d), out_dict, errors, subject, "methyl_v11", timings)
     if "archer_fusion" in sample_jsons:
-        out_dict = parse_archer_json(sample_jsons["archer_fusion"], out_dict)
+        out_dict = parse_isolated(lambda d: parse_archer_json(sample_jsons["archer_fusion"], d), out_dict, errors, subject, "archer_fusion", timings)
     #print(out_dict)
     return out_dict
 
+# Gene Index
+
+# Multi-valued columns indexed by gene, with the assay and tier they report and how the alteration is described.
+# "variant" values are TN variant strings starting with the gene, "fusion" values are Archer fusions such as GENE1::GENE2,
+# and any other kind is a gene list (CNV genes or Archer intragenic breaks) whose alteration is that label.
+# CNV gene lists do not say which tier the CNV was, so their tier is None.
+gene_index_columns = {
+    "TN_Somatic_Tier1":("TN Somatic", "1", "variant"),
+    "TN_Somatic_Tier2":("TN Somatic", "2", "variant"),
+    "TN_Somatic_Tier3":("TN Somatic", "3", "variant"),
+    "TN_Germline_Path":("TN Germline", "Path", "variant"),
+    "TN_Germline_LikelyPath":("TN Germline", "LikelyPath", "variant"),
+    "TN_Germline_VUS":("TN Germline", "VUS", "variant"),
+    "TN_Somatic_CNV_Gene_Loss":("TN Somatic CNV", None, "Loss"),
+    "TN_Somatic_CNV_Gene_BiallelicLoss":("TN Somatic CNV", None, "Biallelic Loss"),
+    "TN_Somatic_CNV_Gene_Gain":("TN Somatic CNV", None, "Gain"),
+    "TN_Somatic_CNV_Gene_Amplification":("TN Somatic CNV", None, "Amplification"),
+    "TN_Somatic_CNV_Gene_LOH":("TN Somatic CNV", None, "LOH"),
+    "TN_Germline_CNV_Gene_Loss":("TN Germline CNV", None, "Loss"),
+    "TN_Germline_CNV_Gene_BiallelicLoss":("TN Germline CNV", None, "Biallelic Loss"),
+    "TN_Germline_CNV_Gene_Gain":("TN Germline CNV", None, "Gain"),
+    "TN_Germline_CNV_Gene_Amplification":("TN Germline CNV", None, "Amplification"),
+    "TN_Germline_CNV_Gene_LOH":("TN Germline CNV", None, "LOH"),
+    "Archer_Tier1-2_Fusions":("Archer Fusion", "1-2", "fusion"),
+    "Archer_Tier3_Fusions":("Archer Fusion", "3", "fusion"),
+    "Archer_Tier1-2_Intragenic":("Archer Intragenic", "1-2", "Intragenic Break"),
+    "Archer_Tier3_Intragenic":("Archer Intragenic", "3", "Intragenic Break")
+}
+
+def get_fusion_genes(fusion:str):
+    # Fusion partners are separated by '::' in current reports. ':', '/', '--' and ' - ' are accepted too.
+    # A single '-' is not split on, since it is part of some gene symbols (e.g. NKX2-1).
+    import re
+    return [i for i in re.split(r"::|:|/|--| - ", fusion) if i.strip() != ""]
+
+def build_gene_index(data:RowStore, blank_field_placeholder:str="."):
+    # Builds the gene -> [subject, assay, tier, alteration] inverted index from the standardized rows.
+    # Genes are keyed in upper case, so lookups are not case sensitive.
+    # Subjects are stored as strings, as in the JSON output's keys, so numeric upi/subject_id values sort and match like the rest.
+    genes = {}
+    columns = [(j, gene_index_columns[j], data.column(j), data.column_present(j)) for j in gene_index_columns if j in data.column_index]
+    subjects = data.column('Sample')
+    for j, (assay, tier, kind), values, present in columns:
+        for i in range(len(data)):
+            if not present[i] or values[i] is None:
+                continue
+            for v in split_values(values[i]):
+                if type(v) is not str or v.strip() in ["", blank_field_placeholder, "N/A", "NA", "n/a"]:
+                    continue
+                v = v.strip()
+                if kind == "variant":
+                    entry_genes = [v.split(" ")[0]]
+                    alteration = v
+                elif kind == "fusion":
+                    entry_genes = get_fusion_genes(v)
+                    alteration = v
+                else:
+                    entry_genes = [v]
+                    alteration = kind
+                for gene in entry_genes:
+                    gene = gene.strip().upper()
+                    if gene not in genes:
+                        genes[gene] = []
+                    genes[gene].append([str(subjects[i]), assay, tier, alteration])
+    return {"version":1, "subjects":len(data), "genes":genes}
+
+def write_gene_index(gene_index:dict, index_path:str):
+    def write(tmp_path):
+        with open(tmp_path, 'w') as index_file:
+            index_file.write(json.dumps(gene_index, separators=(",", ":")))
+    write_atomically(index_path, write)
+
+def load_gene_index(index_path:str):
+    with open(index_path, 'r') as index_file:
+        return json.load(index_file)
+
+def tier_matches(tier:str, tiers:list):
+    # Tiers are compared case-insensitively, and a combined tier such as Archer's "1-2" matches each of its parts as well as the whole.
+    tier = tier.lower()
+    tier_parts = [tier] + tier.split("-")
+    return any([t.strip().lower() in tier_parts for t in tiers])
+
+def query_gene_index(gene_index:dict, genes:list, match:str="any", assays:list=None, tiers:list=None):
+    # Looks up one or more genes. With match "all", only subjects with a matching alteration in every gene are returned.
+    # assays filter entries by case-insensitive substring, e.g. assays=["somatic"]. tiers filter by tier_matches, e.g. tiers=["1"].
+    if match not in ["any", "all"]:
+        raise ValueError(f"Unknown match {match}. Valid matches are: any, all.")
+    genes = [i.strip().upper() for i in genes if i.strip() != ""]
+    results = []
+    subject_genes = {}
+    for gene in genes:
+        for subject, assay, tier, alteration in gene_index["genes"].get(gene, []):
+            if assays is not None and not any([a.lower() in assay.lower() for a in assays]):
+                continue
+            if tiers is not None and (tier is None or not tier_matches(tier, tiers)):
+                continue
+            # Indexes built before subjects were stored as strings may hold numbers.
+            subject = str(subject)
+            results.append({"gene":gene, "subject":subject, "assay":assay, "tier":tier, "alteration":alteration})
+            if subject not in subject_genes:
+                subject_genes[subject] = set()
+            subject_genes[subject].add(gene)
+    if match == "all":
+        results = [i for i in results if len(subject_genes[i["subject"]]) == len(set(genes))]
+    return results
+
+# Output diffing against a previous run
+
+def normalize_output_value(value):
+    # Brings values read back from JSON/Excel/Parquet outputs to a common string form, so that hashes are stable across formats.
+    if value is None:
+        return ""
+    if type(value) is float:
+        if value != value: # NaN, i.e. missing from a DataFrame-based output
+            return ""
+        # Excel truncates floats to 15 significant digits, so floats are compared at a lower precision.
+        return f"{value:.12g}"
+    return str(value)
+
+def row_hash(row_values:list):
+    # Hashes a single subject's values over the data dictionary columns, in data dictionary order.
+    import hashlib
+    row_string = "\x1f".join([normalize_output_value(i) for i in row_values])
+    return hashlib.sha1(row_string.encode("utf-8")).hexdigest()
+
+previous_output_formats = [".json", ".xlsx", ".parquet"]
+
+def check_previous_output(previous_output:str):
+    # Checked before parsing, so that an unreadable previous output does not fail the run only once the cohort has been parsed.
+    import importlib.util
+    if not previous_output.lower().endswith(tuple(previous_output_formats)):
+        raise ValueError(f"Unsupported previous output format: {previous_output}. Expected {', '.join(previous_output_formats)}.")
+    if not os.path.isfile(previous_output):
+        raise FileNotFoundError(f"Previous output not found: {previous_output}")
+    if previous_output.lower().endswith(".parquet"):
+        # pandas reads Parquet through an optional engine, which is not in requirements.txt.
+        if importlib.util.find_spec("pyarrow") is None and importlib.util.find_spec("fastparquet") is None:
+            raise ImportError(f"Reading {previous_output} needs pyarrow or fastparquet (pip install pyarrow).")
+
+def load_previous_output(previous_output:str):
+    # Loads a previous aggregate (JSON, Excel or Parquet) into a dictionary of rows keyed by subject.
+    import pandas as pd
+    prev_rows = {}
+    if previous_output.lower().endswith(".json"):
+        with open(previous_output, 'r') as json_file:
+            prev_json = json.load(json_file)
+        for subject in prev_json['data']:
+            prev_rows[subject] = prev_json['data'][subject]
+    else:
+        if previous_output.lower().endswith(".parquet"):
+            prev_df = pd.read_parquet(previous_output)
+        elif previous_output.lower().endswith(".xlsx"):
+            prev_df = pd.read_excel(previous_output, sheet_name='MCI JSON Data', dtype=object)
+        else:
+            raise ValueError(f"Unsupported previous output format: {previous_output}. Expected {', '.join(previous_output_formats)}.")
+        for row in prev_df.to_dict(orient='records'):
+            prev_rows[normalize_output_value(row['Sample'])] = row
+    return prev_rows
+
+def diff_outputs(prev_rows:dict, data:RowStore, columns:list, log:bool=False):
+    # Compares per-subject row hashes between the previous and current outputs.
+    # Only subjects whose hashes differ are compared field-by-field.
+    # Subjects are keyed like the previous rows, whose keys are always strings (JSON object keys, or normalized Excel/Parquet values).
+    new_rows = {}
+    for i in range(len(data)):
+        new_rows[normalize_output_value(data.get(i, 'Sample'))] = i
+
+    added = {}
+    removed = []
+    changed = {}
+    unchanged = 0
+
+    for subject in new_rows:
+        new_values = data.row_values(new_rows[subject], columns)
+        if subject not in prev_rows:
+            added[subject] = data.row_dict(new_rows[subject])
+            continue
+        prev_values = [prev_rows[subject].get(j) for j in columns]
+        if row_hash(prev_values) == row_hash(new_values):
+            unchanged += 1
+        else:
+            field_changes = {}
+            for j in range(len(columns)):
+                old_value = normalize_output_value(prev_values[j])
+                new_value = normalize_output_value(new_values[j])
+                if old_value != new_value:
+                    field_changes[columns[j]] = {"old":old_value, "new":new_value}
+            changed[subject] = field_changes
+    for subject in prev_rows:
+        if subject not in new_rows:
+            removed.append(subject)
+
+    if log:
+        print(f"Compared against previous output: {len(added)} added, {len(removed)} removed, {len(changed)} changed, {unchanged} unchanged.")
+
+    return {"added":added, "removed":sorted(removed), "changed":changed, "unchanged_count":unchanged}
+
+# Output Writers
+
+def write_atomically(path:str, write_function):
+    # Calls write_function on a temporary file next to the output, then renames it over the output,
+    # so an interrupted or failed write never leaves a partial file behind. The extension is kept, as some writers infer the format from it.
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"
+    try:
+        write_function(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_excel_output(result:dict, path:str):
+    import pandas as pd
+    out_df = result["data"].to_dataframe()
+    def write(tmp_path):
+        with pd.ExcelWriter(tmp_path) as writer:
+            out_df.to_excel(writer, sheet_name='MCI JSON Data',index=False)
+            result["data_dict_table"].drop(columns=['Low Cardinality'], errors='ignore').to_excel(writer, sheet_name='Data Dictionary',index=False)
+    write_atomically(path, write)
+    print(f"Excel sheet writen to: {path}")
+
+def write_json_output(result:dict, path:str):
+    data = result["data"]
+    data_dict_table = result["data_dict_table"]
+    json_formatted_data = {}
+    for i in range(len(data)):
+        row = data.row_dict(i)
+        json_formatted_data[row['Sample']]=row
+    datadict_as_dict = data_dict_table.to_dict()
+    json_formatted_datadict = {}
+    for i in range(len(datadict_as_dict['Term'])):
+        term = datadict_as_dict['Term'][i]
+        definition = datadict_as_dict['Definition'][i]
+        source = datadict_as_dict['JSON Source'][i]
+        note = datadict_as_dict['Notes'][i]
+        rave_id = datadict_as_dict['RAVE Identifier / JSON Field'][i]
+        json_formatted_datadict[term] = {"Definition":definition, "Source":source, "Note":note, "RAVE Identifier or JSON Field":rave_id}
+
+    json_dict = {'data':json_formatted_data, 'dictionary':json_formatted_datadict}
+    def write(tmp_path):
+        with open(tmp_path,'w') as json_file:
+            json_file.write(json.dumps(json_dict))
+    write_atomically(path, write)
+    print(f"JSON written to: {path}")
+
+def write_gene_index_output(result:dict, path:str):
+    write_gene_index(result["gene_index"], path)
+    print(f"Gene index of {len(result['gene_index']['genes'])} genes written to: {path}")
+
+def write_errors_output(result:dict, path:str):
+    # Written on every run, empty if nothing failed, so an error report from an earlier run is never left behind.
+    def write(tmp_path):
+        with open(tmp_path,'w') as json_file:
+            json_file.write(json.dumps(result["errors"]))
+    write_atomically(path, write)
+
+def write_delta_output(result:dict, path:str):
+    def write(tmp_path):
+        with open(tmp_path,'w') as json_file:
+            json_file.write(json.dumps(result["delta"]))
+    write_atomically(path, write)
+    print(f"Delta written to: {path}")
+
+# Writers for --output-type, with the file extension each one writes to. A new format only needs a writer function and an entry here.
+output_writers = {
+    "excel":(write_excel_output, "xlsx"),
+    "json":(write_json_output, "json")
+}
+
+def get_output_writers(output_type:str):
+    # Comma-separated output types, where "Both" means Excel and JSON.
+    output_types = []
+    for i in output_type.lower().split(","):
+        i = i.strip()
+        if i == "both":
+            output_types.extend(["excel", "json"])
+        elif i in output_writers:
+            output_types.append(i)
+        else:
+            raise ValueError(f"Unknown output type {i}. Valid output types are: Both, {', '.join(output_writers)}.")
+    return list(dict.fromkeys(output_types))
+
+def run_output_writers(writer_jobs:list, result:dict, use_processes:bool=None, concurrent:bool=True):
+    # Runs (writer, path) jobs over the same in-memory result, all at once, so the output stage takes about as long as its slowest writer.
+    # The writers are mostly CPU-bound and would take turns on the GIL in threads, so forked processes are used on Linux.
+    # Forked writers share the result with this process, so it is never pickled. Threads are used elsewhere: macOS has fork,
+    # but forking once numpy/pandas/openpyxl are loaded is unsafe there (which is why Python defaults to spawn on macOS).
+    # With concurrent False, writers run one after another in this thread, e.g. so that a profiler sees them.
+    import multiprocessing
+    if use_processes is None:
+        use_processes = sys.platform.startswith("linux")
+    if len(writer_jobs) == 1 or not concurrent:
+        for writer, path in writer_jobs:
+            writer(result, path)
+        return
+    if use_processes:
+        sys.stdout.flush()
+        context = multiprocessing.get_context("fork")
+        processes = []
+        for writer, path in writer_jobs:
+            process = context.Process(target=writer, args=(result, path))
+            process.start()
+            processes.append((process, path))
+        failed = []
+        for process, path in processes:
+            process.join()
+            if process.exitcode != 0:
+                failed.append(path)
+        if len(failed) > 0:
+            raise RuntimeError(f"Could not write: {', '.join(failed)}")
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(writer_jobs)) as executor:
+            futures = [executor.submit(writer, result, path) for writer, path in writer_jobs]
+            for future in futures:
+                future.result()
+
+# Profiling
+
+def get_subject_counts(sample_jsons:dict):
+    # Counts of the things which make a subject's reports expensive to parse.
+    counts = {"follow_ups":0, "variants":0, "cnvs":0, "methylation_scores":0, "fusions":0}
+    try:
+        if sample_jsons.get("cog") is not None:
+            for form in sample_jsons["cog"]["forms"]:
+                if form["form_id"] == "FOLLOW_UP":
+                    counts["follow_ups"] += len([i for i in form if i.startswith("data")])
+        if sample_jsons.get("tumor_normal") is not None:
+            for results, count in [("somatic_results", "variants"), ("germline_results", "variants"), ("somatic_cnv_results", "cnvs"), ("germline_cnv_results", "cnvs")]:
+                counts[count] += len(sample_jsons["tumor_normal"].get(results, {}).get("variants", []))
+        for json_type, scores in [("methyl_v12", "predicted_classification_classifier_scores"), ("methyl_igm", "results")]:
+            if sample_jsons.get(json_type) is not None:
+                counts["methylation_scores"] += len(sample_jsons[json_type].get(scores, []))
+        if sample_jsons.get("archer_fusion") is not None:
+            for results in ["fusion_tier_one_or_two_result", "single_tier_one_or_two_result", "fusion_tier_three_result", "single_tier_three_result"]:
+                counts["fusions"] += len(sample_jsons["archer_fusion"].get(results, {}).get("variants", []))
+    except (KeyError, TypeError, AttributeError):
+        # Malformed reports are reported by the parsers. The counts are only a guide.
+        pass
+    return counts
+
+def get_subject_cost(subject, sample_jsons:dict, timings:dict, file_costs:list):
+    # One subject's decode and parse times, input bytes and counts. file_costs are the subject's own files.
+    cost = {"subject":subject,
+            "total_seconds":sum([i["decode_seconds"] for i in file_costs]) + sum(timings.values()),
+            "parse_seconds":sum(timings.values()),
+            "decode_seconds":sum([i["decode_seconds"] for i in file_costs]),
+            "slowest_report":max(timings, key=timings.get) if len(timings) > 0 else None,
+            "files":len(file_costs),
+            "bytes":sum([i["bytes"] for i in file_costs])}
+    cost.update(get_subject_counts(sample_jsons))
+    return cost
+
+def write_cost_reports(subject_costs:list, file_costs:list, subject_costs_out:str, file_costs_out:str, top:int=10):
+    # Writes the subjects and files ranked from slowest to fastest, and prints the slowest subjects.
+    import pandas as pd
+    subject_df = pd.DataFrame(subject_costs).sort_values("total_seconds", ascending=False)
+    file_df = pd.DataFrame(file_costs, columns=["file", "subject", "json_type", "bytes", "decode_seconds"]).sort_values("decode_seconds", ascending=False)
+    write_atomically(subject_costs_out, lambda tmp_path: subject_df.to_csv(tmp_path, sep="\t", index=False))
+    write_atomically(file_costs_out, lambda tmp_path: file_df.to_csv(tmp_path, sep="\t", index=False))
+    if len(subject_df) > 0:
+        print(f"Slowest subjects:\n{subject_df.head(top).to_string(index=False)}")
+    print(f"Subject costs written to: {subject_costs_out}")
+    print(f"File costs written to: {file_costs_out}")
+
+def run_profiled(args:argparse.Namespace, run_function):
+    # With --profile, runs under cProfile and dumps the stats to <output-prefix>.profile.pstats,
+    # which pstats, snakeviz, or gprof2dot/flameprof (for flame graphs) can read. Only the main thread is profiled.
+    if not args.profile:
+        return run_function()
+    import cProfile, pstats
+    profile_out = os.path.join(os.path.dirname(args.output_prefix), f"{args.output_prefix}.profile.pstats")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return run_function()
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_out)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+        print(f"Profile written to: {profile_out}")
+
 # Main function
 
-def run_json_parser(args: argparse.Namespace) -> None:
+def read_data_dict(data_dict_reference:str, shared_cache:dict=None):
+    # With a shared cache, each data dictionary file is only read once per batch, unless it changes.
     import pandas as pd
+    if shared_cache is None:
+        return pd.read_csv(data_dict_reference, delimiter="\t", header=0,index_col = 0,keep_default_na=False)
+    key = (os.path.abspath(data_dict_reference), os.stat(data_dict_reference).st_mtime)
+    if key not in shared_cache["data_dicts"]:
+        shared_cache["data_dicts"][key] = pd.read_csv(data_dict_reference, delimiter="\t", header=0,index_col = 0,keep_default_na=False)
+    return shared_cache["data_dicts"][key].copy()
+
+def run_json_parser(args: argparse.Namespace, shared_cache:dict=None, write_outputs:bool=True) -> dict:
+    # shared_cache is given by batch runs, see run_batch. Returns the in-memory result, which serve mode keeps instead of writing outputs.
     import os
 
     json_dirs = args.input_json_dirs.split(",") #"/sbgenomics/project-files/*/" #"/Users/glw001/Projects/MCI_Report_JSONs/MCI_4-5-2024/"
     out_dir = os.path.dirname(args.output_prefix)
     #file_prefix = os.path.basename(args.output_prefix)
-    excel_out = os.path.join(out_dir, f"{args.output_prefix}.xlsx")
-    json_out = os.path.join(out_dir, f"{args.output_prefix}.json")
+    delta_out = os.path.join(out_dir, f"{args.output_prefix}.delta.json")
+    index_path = args.file_index if args.file_index is not None else os.path.join(out_dir, f"{args.output_prefix}.file_index.json")
+    checkpoint_out = os.path.join(out_dir, f"{args.output_prefix}.checkpoint.jsonl")
+    gene_index_out = os.path.join(out_dir, f"{args.output_prefix}.gene_index.json")
+    errors_out = os.path.join(out_dir, f"{args.output_prefix}.errors.json")
+    subject_costs_out = os.path.join(out_dir, f"{args.output_prefix}.subject_costs.tsv")
+    file_costs_out = os.path.join(out_dir, f"{args.output_prefix}.file_costs.tsv")
 
     debug=True
 
+    output_types = get_output_writers(args.output_type)
+    if args.previous_output is not None:
+        check_previous_output(args.previous_output)
     blank_field_placeholder = args.blank_field_indicator
     mci_dict_reference = args.data_dict_reference
 
     if debug:
         print("Processing data dictionary...")
-    data_dict_table = pd.read_csv(mci_dict_reference, delimiter="\t", header=0,index_col = 0,keep_default_na=False)
+    data_dict_table = read_data_dict(mci_dict_reference, shared_cache)
     if debug:
         print(data_dict_table)
 
+    requested_fields = resolve_field_projection(data_dict_table, args.fields, args.field_set)
+    parsed_fields = get_parsed_fields(requested_fields)
+    json_types = get_needed_json_types(data_dict_table, parsed_fields)
+    # Rows hold every parsed field until standardization. The output only has the requested ones.
+    parsed_terms = list(data_dict_table['Term'])
+    if requested_fields is not None:
+        parsed_terms = [i for i in parsed_terms if i in parsed_fields]
+        data_dict_table = data_dict_table[data_dict_table['Term'].isin(requested_fields)].reset_index(drop=True)
+        if debug:
+            print(f"Projecting {len(data_dict_table)} fields from report types: {', '.join(sorted(json_types))}")
+
     if debug:
         print("Reading in data JSONs...")
-    json_dicts = sort_jsons(json_dirs, debug)
+    file_index = load_file_index(index_path)
+    subjects = parse_subject_list(args.subjects)
+    errors = []
+    # With --profile, decode and parse costs are recorded per file and per subject.
+    file_costs = [] if args.profile else None
+    subject_costs = []
+
+    # Subjects completed by an interrupted run with the same inputs and options are neither re-read nor re-parsed.
+    run_signature = {"input_json_dirs":args.input_json_dirs, "blank_field_indicator":blank_field_placeholder,
+                     "fields":None if requested_fields is None else sorted(requested_fields), "subjects":None if subjects is None else sorted(subjects)}
+    completed = {}
+    completed_errors = {}
+    if args.resume:
+        completed = load_checkpoint(checkpoint_out, run_signature, completed_errors)
+        # Errors recorded for completed subjects are reported again, as those subjects are not re-parsed.
+        for i in completed_errors:
+            errors.extend(completed_errors[i])
+        if debug:
+            print(f"Resuming with {len(completed)} subjects completed by a previous run.")
+
+    json_dicts = sort_jsons(json_dirs, debug, args.prefetch_workers, int(args.prefetch_buffer_mb*1024*1024), json_types, file_index, subjects,
+                            set([str(i) for i in completed]) if len(completed) > 0 else None, errors,
+                            shared_cache["reports"] if shared_cache is not None else None, file_costs)
+    # Serve mode writes nothing, the index included.
+    if write_outputs:
+        write_file_index(file_index, index_path)
+        if debug:
+            print(f"File index written to: {index_path}")
 
     if debug:
         print(f"Got {len(json_dicts)} samples' data.")
 
-    data = []
+    # Rows are collected column-wise, in data dictionary order. With a projection, keys outside it are dropped.
+    data = RowStore(parsed_terms, len(completed) + len(json_dicts), keep_extras=requested_fields is None,
+                    low_cardinality=get_low_cardinality_columns(data_dict_table))
+    for i in completed:
+        data.append(completed[i])
+    checkpoint_file = None
+    if args.checkpoint_every > 0:
+        checkpoint_file = start_checkpoint(checkpoint_out, run_signature, list(completed.values()), completed_errors)
+    pending = []
+    pending_rows = 0
+
+    subject_file_costs = {}
+    if file_costs is not None:
+        for i in file_costs:
+            if i["subject"] is not None:
+                subject_file_costs.setdefault(i["subject"], []).append(i)
 
     for i in json_dicts:
         #print(i)
         sample_jsons = json_dicts[i]
-        out_dict = replace_blank_fields(parse_sample_jsons(sample_jsons), blank_field_placeholder)
+        timings = {} if args.profile else None
+        errors_before = len(errors)
+        out_dict = replace_blank_fields(parse_sample_jsons(sample_jsons, parsed_fields, errors, i, data.new_record(), timings), blank_field_placeholder)
+        if args.profile:
+            subject_costs.append(get_subject_cost(i, sample_jsons, timings, subject_file_costs.get(i, [])))
         out_dict['Sample']=i
-        data.append(out_dict)
+        row = data.append(out_dict)
+        if checkpoint_file is not None:
+            # The subject's errors go before its row, so a row is never resumed without them.
+            if len(errors) > errors_before:
+                pending.append({"subject_errors":errors[errors_before:]})
+            pending.append(data.row_dict(row))
+            pending_rows += 1
+            if pending_rows >= args.checkpoint_every:
+                append_checkpoint(checkpoint_file, pending)
+                pending = []
+                pending_rows = 0
+
+    if checkpoint_file is not None:
+        append_checkpoint(checkpoint_file, pending)
+        checkpoint_file.close()
 
     data = standardize_variant_notation(data, debug=debug)
     
     data = standardize_methylation_class(data, debug=debug)
 
-    out_df = pd.DataFrame(data, columns=list(data_dict_table['Term']))
+    if requested_fields is not None:
+        data.drop_columns([i for i in parsed_terms if i not in requested_fields])
 
-    if args.output_type.lower() in ['excel','both']:
-        with pd.ExcelWriter(excel_out) as writer:  
-            out_df.to_excel(writer, sheet_name='MCI JSON Data',index=False)
-            data_dict_table.to_excel(writer, sheet_name='Data Dictionary',index=False)
-            print(f"Excel sheet writen to: {excel_out}")
-    
-    if args.output_type.lower() in ['json','both']:
-        json_formatted_data = {}
-        for i in data:
-            json_formatted_data[i['Sample']]=i
-        datadict_as_dict = data_dict_table.to_dict()
-        json_formatted_datadict = {}
-        for i in range(len(datadict_as_dict['Term'])):
-            term = datadict_as_dict['Term'][i]
-            definition = datadict_as_dict['Definition'][i]
-            source = datadict_as_dict['JSON Source'][i]
-            note = datadict_as_dict['Notes'][i]
-            rave_id = datadict_as_dict['RAVE Identifier / JSON Field'][i]
-            json_formatted_datadict[term] = {"Definition":definition, "Source":source, "Note":note, "RAVE Identifier or JSON Field":rave_id}
-
-        json_dict = {'data':json_formatted_data, 'dictionary':json_formatted_datadict}
-        with open(json_out,'w') as json_file:
-            json_file.write(json.dumps(json_dict))
-        print(f"JSON written to: {json_out}")
+    # The gene index is built from the standardized variants, before multi-valued fields are joined.
+    gene_index = build_gene_index(data, blank_field_placeholder) if args.gene_index else None
+
+    # Multi-valued fields are joined into their output strings here, once.
+    data.join_multi_values()
+    result = {"data":data, "data_dict_table":data_dict_table, "gene_index":gene_index, "errors":errors}
+    writer_jobs = []
+
+    # Serve mode only needs the in-memory result.
+    if not write_outputs:
+        return result
+
+    if args.previous_output is not None:
+        if debug:
+            print(f"Loading previous output {args.previous_output}...")
+        prev_rows = load_previous_output(args.previous_output)
+        delta = diff_outputs(prev_rows, data, list(data_dict_table['Term']), debug)
+        delta['previous_output'] = args.previous_output
+        result["delta"] = delta
+        writer_jobs.append((write_delta_output, delta_out))
+
+    write_full_outputs = args.previous_output is None or not args.delta_only
+
+    if write_full_outputs:
+        for i in output_types:
+            writer, extension = output_writers[i]
+            writer_jobs.append((writer, os.path.join(out_dir, f"{args.output_prefix}.{extension}")))
+        if gene_index is not None:
+            writer_jobs.append((write_gene_index_output, gene_index_out))
+
+    if len(writer_jobs) > 0:
+        # Under --profile, writers run in this thread so their cost shows up in the profile.
+        run_output_writers(writer_jobs, result, concurrent=not args.profile)
+
+    if args.profile:
+        write_cost_reports(subject_costs, file_costs, subject_costs_out, file_costs_out)
+
+    write_errors_output(result, errors_out)
+    if len(errors) > 0:
+        print(f"WARNING! {len(errors)} files or reports could not be processed. Error report written to: {errors_out}")
+
+    # The run finished, so there is nothing left to resume.
+    if checkpoint_file is not None and os.path.exists(checkpoint_out):
+        os.remove(checkpoint_out)
+
+    return result
+
+# Batch Mode
+
+def job_to_argv(job:dict):
+    # Turns a job's options into command line arguments, so jobs are validated and defaulted the same way as single runs.
+    # Keys are option names, e.g. "input-json-dirs" or "input_json_dirs". Lists are joined with commas.
+    argv = []
+    for key, value in job.items():
+        flag = f"--{key.replace('_', '-')}"
+        if value is True:
+            argv.append(flag)
+        elif value is False:
+            if flag == "--gene-index":
+                argv.append("--no-gene-index")
+        elif value is not None:
+            if type(value) is list:
+                value = ",".join([f"{i}" for i in value])
+            argv.extend([flag, f"{value}"])
+    return argv
+
+def run_batch(job_file:str, parser:argparse.ArgumentParser, cache_mb:float=1024):
+    # Runs every job in a job file in this process. pandas is imported once, the methylation reference is loaded once,
+    # and data dictionaries and decoded reports are shared between jobs through a bounded cache.
+    # The job file is JSON: a list of jobs, or {"defaults": {...}, "jobs": [...]} where defaults apply to every job.
+    # A failed job is reported and the remaining jobs still run.
+    with open(job_file, 'r') as in_file:
+        batch = json.load(in_file)
+    if type(batch) is list:
+        batch = {"jobs":batch}
+    defaults = batch.get("defaults", {})
+    shared_cache = {"reports":ReportCache(int(cache_mb*1024*1024)), "data_dicts":{}}
+
+    failed = []
+    for n, job in enumerate(batch["jobs"]):
+        job_options = dict(defaults)
+        job_options.update(job)
+        try:
+            job_args = parser.parse_args(job_to_argv(job_options))
+        except SystemExit:
+            # argparse has already printed the problem, e.g. an unknown or misspelled option.
+            print(f"ERROR: Job {n+1} has invalid options. Skipping.")
+            failed.append(n+1)
+            continue
+        if job_args.input_json_dirs is None or job_args.output_prefix is None:
+            print(f"ERROR: Job {n+1} needs input-json-dirs and output-prefix. Skipping.")
+            failed.append(n+1)
+            continue
+        print(f"Running job {n+1} of {len(batch['jobs'])}: {job_args.output_prefix}")
+        try:
+            result = run_profiled(job_args, lambda: run_json_parser(job_args, shared_cache))
+            if len(result["errors"]) > 0 and not job_args.allow_errors:
+                print(f"ERROR: Job {n+1} ({job_args.output_prefix}) could not process {len(result['errors'])} files or reports.")
+                failed.append(n+1)
+        except Exception as e:
+            print(f"ERROR: Job {n+1} ({job_args.output_prefix}) failed ({type(e).__name__}: {str(e)}).")
+            failed.append(n+1)
+        print(f"Report cache: {shared_cache['reports'].hits} reused, {shared_cache['reports'].misses} read, {len(shared_cache['reports'].entries)} held.")
+
+    if len(failed) > 0:
+        print(f"WARNING! {len(failed)} of {len(batch['jobs'])} jobs failed: {', '.join([str(i) for i in failed])}")
+        sys.exit(1)
+
+# Serve Mode
+
+def get_input_manifest(json_dir_list:list):
+    # The input JSON files with their sizes and modification times. Any added, removed or modified file changes the manifest.
+    manifest = {}
+    for i in iter_dir_jsons(json_dir_list):
+        try:
+            file_stat = os.stat(i)
+            manifest[i] = [file_stat.st_size, file_stat.st_mtime]
+        except OSError:
+            pass
+    return manifest
+
+class AggregateServer:
+    # Keeps the aggregate in memory and answers subject, column and gene queries from it.
+    # Reloads build a new aggregate off to the side and swap it in whole, so requests always see one complete aggregate.
+    # Decoded reports are cached between reloads, so a reload only reads and decodes files which changed.
+    def __init__(self, args:argparse.Namespace, cache_mb:float=1024):
+        import threading
+        self.args = args
+        self.shared_cache = {"reports":ReportCache(int(cache_mb*1024*1024)), "data_dicts":{}}
+        self.reload_lock = threading.Lock()
+        self.state = None
+        self.reloads = 0
+
+    def load(self, manifest:dict=None):
+        import time
+        with self.reload_lock:
+            if manifest is None:
+                manifest = get_input_manifest(self.args.input_json_dirs.split(","))
+            start = time.time()
+            result = run_json_parser(self.args, self.shared_cache, write_outputs=False)
+            data = result["data"]
+            subjects = {}
+            for i in range(len(data)):
+                subjects[f"{data.get(i, 'Sample')}"] = i
+            self.state = {"result":result, "subjects":subjects, "manifest":manifest, "loaded_at":time.time(), "load_seconds":time.time() - start}
+            self.reloads += 1
+            print(f"Serving {len(subjects)} subjects, loaded in {self.state['load_seconds']:.1f} seconds.")
+            if len(result["errors"]) > 0:
+                print(f"WARNING! {len(result['errors'])} files or reports could not be processed. They are listed at /errors.")
+
+    def reload_if_changed(self):
+        manifest = get_input_manifest(self.args.input_json_dirs.split(","))
+        if manifest != self.state["manifest"]:
+            print("Input files changed. Reloading...")
+            self.load(manifest)
+            return True
+        return False
+
+    def watch(self, poll_seconds:float):
+        # Polls the input manifest in a background thread. Errors are reported and the current aggregate stays up.
+        import threading, time
+        def poll():
+            while True:
+                time.sleep(poll_seconds)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    print(f"ERROR: Reload failed ({type(e).__name__}: {str(e)}). Still serving the previous aggregate.")
+        threading.Thread(target=poll, daemon=True).start()
+
+    def status(self):
+        state = self.state
+        return {"subjects":len(state["subjects"]), "files":len(state["manifest"]), "loaded_at":state["loaded_at"],
+                "load_seconds":state["load_seconds"], "reloads":self.reloads, "errors":len(state["result"]["errors"])}
+
+    def list_errors(self):
+        # The error records of the current aggregate, as written to <output-prefix>.errors.json by normal runs.
+        return self.state["result"]["errors"]
+
+    def list_subjects(self):
+        return list(self.state["subjects"])
+
+    def get_subject(self, subject:str, fields:list=None):
+        # Returns None for an unknown subject.
+        state = self.state
+        row = state["subjects"].get(subject)
+        if row is None:
+            return None
+        data = state["result"]["data"]
+        if fields is None:
+            return data.row_dict(row)
+        return {j:data.get(row, j) for j in fields if data.has(row, j)}
+
+    def get_columns(self, fields:list, subjects:list=None):
+        # Projects the given columns for the given subjects, or for every subject.
+        state = self.state
+        data = state["result"]["data"]
+        unknown = [j for j in fields if j not in data.column_index]
+        if len(unknown) > 0:
+            raise ValueError(f"Unknown field {unknown[0]}. Fields must match a Term in the data dictionary.")
+        rows = state["subjects"] if subjects is None else {i:state["subjects"][i] for i in subjects if i in state["subjects"]}
+        columns = [(j, data.column(j), data.column_present(j)) for j in fields]
+        out_dict = {}
+        for subject, row in rows.items():
+            out_dict[subject] = {j:values[row] for j, values, present in columns if present[row]}
+        return out_dict
+
+    def query_genes(self, genes:list, match:str="any", assays:list=None, tiers:list=None):
+        return query_gene_index(self.state["result"]["gene_index"], genes, match, assays, tiers)
+
+def make_request_handler(server:AggregateServer):
+    # Read-only JSON endpoints:
+    #   GET  /status                              load time, subject, file and error counts
+    #   GET  /errors                              files and reports which could not be processed
+    #   GET  /subjects                            subject IDs
+    #   GET  /subjects/<subject>[?fields=A,B]     a subject's row, optionally projected
+    #   GET  /columns?fields=A,B[&subjects=X,Y]   columns for every subject, or the given subjects
+    #   GET  /genes?genes=G1,G2[&match=all][&assays=...][&tiers=...]
+    #   POST /reload                              reload now if any input file changed
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qs, unquote
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        # Keep-alive connections, so clients making many lookups do not pay for a new connection on each one.
+        # Nagle's algorithm would otherwise hold back each response body until the client acknowledges the headers.
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def send_json(self, status:int, body):
+            out_bytes = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out_bytes)))
+            self.end_headers()
+            self.wfile.write(out_bytes)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {k:v[-1] for k, v in parse_qs(url.query).items()}
+            list_param = lambda key: None if key not in query else [i.strip() for i in query[key].split(",") if i.strip() != ""]
+            parts = [unquote(i) for i in url.path.strip("/").split("/") if i != ""]
+            try:
+                if parts == ["status"]:
+                    self.send_json(200, server.status())
+                elif parts == ["errors"]:
+                    self.send_json(200, server.list_errors())
+                elif parts == ["subjects"]:
+                    self.send_json(200, server.list_subjects())
+                elif len(parts) == 2 and parts[0] == "subjects":
+                    row = server.get_subject(parts[1], list_param("fields"))
+                    if row is None:
+                        self.send_json(404, {"error":f"Unknown subject {parts[1]}."})
+                    else:
+                        self.send_json(200, row)
+                elif parts == ["columns"]:
+                    if list_param("fields") is None:
+                        self.send_json(400, {"error":"fields is required."})
+                    else:
+                        self.send_json(200, server.get_columns(list_param("fields"), list_param("subjects")))
+                elif parts == ["genes"]:
+                    if list_param("genes") is None:
+                        self.send_json(400, {"error":"genes is required."})
+                    else:
+                        self.send_json(200, server.query_genes(list_param("genes"), query.get("match", "any"), list_param("assays"), list_param("tiers")))
+                else:
+                    self.send_json(404, {"error":f"Unknown path {url.path}."})
+            except ValueError as e:
+                self.send_json(400, {"error":str(e)})
+
+        def do_POST(self):
+            if urlsplit(self.path).path.strip("/") == "reload":
+                self.send_json(200, {"reloaded":server.reload_if_changed()})
+            else:
+                self.send_json(404, {"error":f"Unknown path {self.path}."})
+
+        def log_message(self, format, *args):
+            # Requests are not logged, to keep lookups fast.
+            pass
+
+    return RequestHandler
+
+def run_server(args:argparse.Namespace):
+    # Nothing is written in serve mode (outputs, checkpoints or the file index). The gene index is always built for /genes.
+    from http.server import ThreadingHTTPServer
+    args.checkpoint_every = 0
+    args.gene_index = True
+    server = AggregateServer(args, args.batch_cache_mb)
+    server.load()
+    if args.serve_poll_seconds > 0:
+        server.watch(args.serve_poll_seconds)
+    http_server = ThreadingHTTPServer((args.serve_host, args.serve_port), make_request_handler(server))
+    print(f"Serving the aggregate at http://{args.serve_host}:{args.serve_port}/")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
 
 def mci_json_argparser():
     parser = argparse.ArgumentParser(
         prog=mci_json_argparser.__name__, description="")
     parser.add_argument(
-        '--input-json-dirs', required=True,
-        help="String of comma separated directory paths where JSON files are located.")
+        '--input-json-dirs', required=False, default=None,
+        help="String of comma separated directory paths where JSON files are located. Required unless --job-file is given.")
     parser.add_argument(
         '--output-type',
-        help="Format of output data file(s).", choices=["Excel","JSON","Both"], default="Both")
+        help="Format of output data file(s): Excel, JSON or Both. Several formats can be given comma-separated, and are written concurrently.", default="Both")
     parser.add_argument(
         '--data-dict-reference', required=False, default="./mci_data_dict.txt",
         help="Path to text file containing data dictionary to include in Excel outputs.")
@@ -1011,15 +2730,82 @@ def mci_json_argparser():
         '--blank-field-indicator', required=False, default=".",
         help="Fields that are present but blank (as opposed to missing) will be indicated with the specified string.")
     parser.add_argument(
-        '--output-prefix', type=str, required=True,
-        help="Processed data output prefix.")
+        '--output-prefix', type=str, required=False, default=None,
+        help="Processed data output prefix. Required unless --job-file is given.")
+    parser.add_argument(
+        '--fields', type=str, required=False, default=None,
+        help="Comma-separated list of data dictionary terms to output. Only the report types and parser sections needed for them are processed.")
+    parser.add_argument(
+        '--field-set', type=str, required=False, default=None,
+        help="Comma-separated list of data dictionary 'JSON Source' groups to output, e.g. COG or Methylation,Archer. Combined with --fields.")
+    parser.add_argument(
+        '--subjects', type=str, required=False, default=None,
+        help="Only process these subjects. Either a comma-separated list, or a file with one subject ID per line. Uses the file index to open only their files.")
+    parser.add_argument(
+        '--file-index', type=str, required=False, default=None,
+        help="Path to the persistent subject-to-file index, which is created or updated on every run. Defaults to <output-prefix>.file_index.json.")
+    parser.add_argument(
+        '--checkpoint-every', type=int, required=False, default=100,
+        help="Append completed subjects to <output-prefix>.checkpoint.jsonl after every N subjects, so an interrupted run can be resumed. 0 disables checkpoints.")
+    parser.add_argument(
+        '--resume', action='store_true',
+        help="Resume an interrupted run from <output-prefix>.checkpoint.jsonl, skipping subjects it already completed.")
+    parser.add_argument(
+        '--allow-errors', action='store_true',
+        help="Exit with status 0 even if some files or reports could not be processed. By default such runs still write their outputs, but exit with status 1.")
+    parser.add_argument(
+        '--prefetch-workers', type=int, required=False, default=8,
+        help="Number of JSON files read concurrently. Higher values help on high-latency storage such as FUSE mounts or NFS. 0 reads files serially.")
+    parser.add_argument(
+        '--prefetch-buffer-mb', type=float, required=False, default=512,
+        help="Maximum megabytes of read-ahead file data held in memory while waiting to be parsed.")
+    parser.add_argument(
+        '--previous-output', type=str, required=False, default=None,
+        help="Path to a previous JSON, Excel or Parquet output. Subjects added, removed or changed since then are written to <output-prefix>.delta.json.")
+    parser.add_argument(
+        '--delta-only', action='store_true',
+        help="With --previous-output, write only the delta file and skip the full Excel/JSON outputs.")
+    parser.add_argument(
+        '--gene-index', action=argparse.BooleanOptionalAction, default=True,
+        help="Write <output-prefix>.gene_index.json, an index of subjects' alterations by gene for Query-MCI_Gene_Index.py. Use --no-gene-index to skip it.")
+    parser.add_argument(
+        '--job-file', type=str, required=False, default=None,
+        help="Run every job in this JSON job file in one process, sharing cached data dictionaries and decoded reports between jobs. Other options are ignored.")
+    parser.add_argument(
+        '--batch-cache-mb', type=float, required=False, default=1024,
+        help="With --job-file or --serve, maximum megabytes of JSON files kept decoded in memory for reuse by later jobs or reloads.")
+    parser.add_argument(
+        '--profile', action='store_true',
+        help="Profile the run with cProfile into <output-prefix>.profile.pstats, and write per-subject and per-file costs, slowest first, to <output-prefix>.subject_costs.tsv and .file_costs.tsv.")
+    parser.add_argument(
+        '--serve', action='store_true',
+        help="Build the aggregate in memory and serve subject, column and gene queries over HTTP instead of writing outputs.")
+    parser.add_argument(
+        '--serve-host', type=str, required=False, default="127.0.0.1",
+        help="With --serve, address to listen on.")
+    parser.add_argument(
+        '--serve-port', type=int, required=False, default=8765,
+        help="With --serve, port to listen on.")
+    parser.add_argument(
+        '--serve-poll-seconds', type=float, required=False, default=30,
+        help="With --serve, how often to check the input files for changes and reload. 0 disables reloading.")
 
     return parser
 
 def main():
     parser = mci_json_argparser()
     args = parser.parse_args()
-    run_json_parser(args)
+    if args.job_file is not None:
+        run_batch(args.job_file, parser, args.batch_cache_mb)
+    elif args.input_json_dirs is None or args.output_prefix is None:
+        parser.error("the following arguments are required: --input-json-dirs, --output-prefix")
+    elif args.serve:
+        run_server(args)
+    else:
+        result = run_profiled(args, lambda: run_json_parser(args))
+        # Outputs are still written, but failed files or reports make the run exit non-zero unless --allow-errors is given.
+        if len(result["errors"]) > 0 and not args.allow_errors:
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,61 @@
+import argparse, importlib.util, json, os, sys
+
+# Answers gene lookups against the <output-prefix>.gene_index.json file written by Parse-MCI_JSONs.py,
+# without re-running the aggregation.
+
+def load_parser_module():
+    # The aggregator script is not importable by name, so it is loaded from the same directory as this script.
+    script_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "Parse-MCI_JSONs.py")
+    spec = importlib.util.spec_from_file_location("parse_mci_jsons", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run_gene_query(args: argparse.Namespace) -> None:
+    mci = load_parser_module()
+    gene_index = mci.load_gene_index(args.gene_index)
+    assays = args.assays.split(",") if args.assays is not None else None
+    tiers = args.tiers.split(",") if args.tiers is not None else None
+    results = mci.query_gene_index(gene_index, args.genes.split(","), args.match, assays, tiers)
+
+    if args.output_type.lower() == "json":
+        print(json.dumps(results, indent=1))
+    elif args.output_type.lower() == "subjects":
+        for subject in sorted(set([i["subject"] for i in results])):
+            print(subject)
+    else:
+        print("\t".join(["Gene", "Subject", "Assay", "Tier", "Alteration"]))
+        for i in results:
+            print("\t".join([i["gene"], f"{i['subject']}", i["assay"], "" if i["tier"] is None else i["tier"], i["alteration"]]))
+        print(f"{len(results)} alterations in {len(set([i['subject'] for i in results]))} of {gene_index['subjects']} subjects.", file=sys.stderr)
+
+def gene_query_argparser():
+    parser = argparse.ArgumentParser(
+        prog=gene_query_argparser.__name__, description="Query an MCI gene index for subjects with alterations in one or more genes.")
+    parser.add_argument(
+        '--gene-index', type=str, required=True,
+        help="Path to a <output-prefix>.gene_index.json file.")
+    parser.add_argument(
+        '--genes', type=str, required=True,
+        help="Comma-separated list of genes to look up, e.g. BRAF or BRAF,KIAA1549. Not case sensitive.")
+    parser.add_argument(
+        '--match', required=False, default="any", choices=["any","all"],
+        help="For several genes, return subjects with an alteration in any of them, or only subjects with alterations in all of them.")
+    parser.add_argument(
+        '--assays', type=str, required=False, default=None,
+        help="Comma-separated assays to include, matched as substrings, e.g. Somatic or Archer.")
+    parser.add_argument(
+        '--tiers', type=str, required=False, default=None,
+        help="Comma-separated tiers to include, e.g. 1,2,Path. Archer's combined tier 1-2 is matched by 1, 2 or 1-2. CNV gene lists have no tier and are left out when this is set.")
+    parser.add_argument(
+        '--output-type', required=False, default="Table", choices=["Table","JSON","Subjects"],
+        help="Tab-separated table of alterations, JSON list of alterations, or only the matching subject IDs.")
+    return parser
+
+def main():
+    parser = gene_query_argparser()
+    args = parser.parse_args()
+    run_gene_query(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import importlib.util, json, os, random, tempfile, unittest
+from unittest import mock
+
+# Checks the partial JSON extractor (extract_json_paths, extract_raw_methylation, read_file_bytes) against full decodes with json.loads.
+# Runs with python -m unittest discover tests, or pytest.
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+spec = importlib.util.spec_from_file_location("parse_mci_jsons", os.path.join(repo_dir, "scripts", "Parse-MCI_JSONs.py"))
+mci = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mci)
+
+def full_decode(json_bytes:bytes):
+    return json.loads(json_bytes, object_pairs_hook=mci.handle_duplicates)
+
+def get_path(value, path:tuple):
+    for i in path:
+        value = value[i]
+    return value
+
+def random_value(depth:int=0):
+    # Nested values with escapes, brackets and quotes inside strings, unicode, and every scalar type.
+    r = random.random()
+    if depth > 3 or r < 0.4:
+        return random.choice([1, -2.5e-3, 1e10, "a\"b\\c]{", "}],\"[{", "é中", "tab\tnew\nline", "", None, True, False])
+    if r < 0.7:
+        return [random_value(depth+1) for i in range(random.randint(0, 4))]
+    return {random.choice(["k", "x\\y", "\"q\"", "]}"]) + str(i): random_value(depth+1) for i in range(random.randint(0, 4))}
+
+class TestExtractJsonPaths(unittest.TestCase):
+    def test_matches_full_decode(self):
+        random.seed(0)
+        paths = [("a", "b"), ("list", 1), ("list", 3, "c"), ("esc\"aped", 0), ("last",)]
+        for n in range(500):
+            doc = {"before":random_value(), "a":{"x":random_value(), "b":random_value()}, "list":[random_value(), random_value(), random_value(), {"c":random_value()}],
+                   "esc\"aped":[random_value()], "last":random_value()}
+            keys = list(doc)
+            random.shuffle(keys)
+            json_bytes = json.dumps({k:doc[k] for k in keys}, indent=random.choice([None, 0, 2]), ensure_ascii=random.random() < 0.5).encode("utf-8")
+            extracted = mci.extract_json_paths(json_bytes, paths)
+            for path in paths:
+                self.assertEqual(get_path(extracted, path), get_path(full_decode(json_bytes), path))
+
+    def test_escaped_keys(self):
+        json_bytes = b'{"k\\u0065y": [1, {"n\\"ested": "v\\\\al"}], "other": "}"}'
+        extracted = mci.extract_json_paths(json_bytes, [("key", 1, 'n"ested'), ("other",)])
+        self.assertEqual(extracted["key"][1], full_decode(json_bytes)["key"][1])
+        self.assertEqual(extracted["other"], "}")
+
+    def test_duplicate_keys(self):
+        # The first of duplicated keys keeps its name in a full decode, so it is the one extracted.
+        json_bytes = b'{"meta_data": {"report_title": "first"}, "meta_data": {"report_title": "second"}}'
+        extracted = mci.extract_json_paths(json_bytes, [("meta_data", "report_title")])
+        self.assertEqual(extracted["meta_data"], full_decode(json_bytes)["meta_data"])
+
+    def test_missing_paths_are_left_out(self):
+        extracted = mci.extract_json_paths(b'{"a": [1], "b": 2}', [("a", 3), ("c", "d"), ("b",)])
+        self.assertEqual(extracted, {"a":[], "b":2})
+
+    def test_stop_keys(self):
+        self.assertIsNone(mci.extract_json_paths(b'{"subject_id": "P1", "meta_data": {"report_title": "Methylation"}}', [("meta_data", "report_title")], ("subject_id",)))
+
+    def test_malformed(self):
+        for json_bytes in [b'[1, 2]', b'{"a": [1, 2', b'{"a": "unterminated', b'{"a": {"b": 1}']:
+            with self.assertRaises(ValueError):
+                mci.extract_json_paths(json_bytes, [("a", "b"), ("c",)])
+
+class TestExtractRawMethylation(unittest.TestCase):
+    def make_raw(self, title:str="Methylation v11 raw", title_last:bool=False, beta_values:int=1000):
+        raw = {"family_data":[{"methylation_family":"MCF ETMR", "family_score":0.9}]*3, "class_data":[{"methylation_class":"MB, WNT", "class_score":0.8}]*3,
+               "mgmt_methylation_data":[{"mgmt_methylation_status":"Unmethylated"}], "beta_values":[i/beta_values for i in range(beta_values)]}
+        raw = {**raw, "meta_data":{"report_title":title}} if title_last else {"meta_data":{"report_title":title}, **raw}
+        return json.dumps(raw).encode("utf-8")
+
+    def check_v11(self, extracted:dict, json_bytes:bytes):
+        full = full_decode(json_bytes)
+        self.assertEqual(extracted["meta_data"]["report_title"], full["meta_data"]["report_title"])
+        for i in ["family_data", "class_data", "mgmt_methylation_data"]:
+            self.assertEqual(extracted[i][0], full[i][0])
+
+    def test_title_before_and_after_beta_values(self):
+        for title_last in [False, True]:
+            json_bytes = self.make_raw(title_last=title_last)
+            self.check_v11(mci.extract_raw_methylation(json_bytes), json_bytes)
+
+    def test_v12_only_needs_title(self):
+        self.assertEqual(mci.extract_raw_methylation(self.make_raw("Methylation v12 raw")), {"meta_data":{"report_title":"Methylation v12 raw"}})
+
+    def test_reports_are_not_extracted(self):
+        self.assertIsNone(mci.extract_raw_methylation(b'{"subject_id": "P1", "report_type": "methylation", "meta_data": {"report_title": "Methylation"}}'))
+        self.assertIsNone(mci.extract_raw_methylation(b'{"upi": "P1", "forms": []}'))
+        self.assertIsNone(mci.extract_raw_methylation(b'{"meta_data": {"report_title": "Other"}}'))
+
+    def test_read_file_bytes(self):
+        json_bytes = self.make_raw(beta_values=500000)
+        self.assertGreaterEqual(len(json_bytes), mci.mmap_min_bytes)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "x-PAT00001-raw.json")
+            with open(path, 'wb') as out_file:
+                out_file.write(json_bytes)
+            contents, mtime = mci.read_file_bytes(path)
+            self.assertIsInstance(contents, mci.ExtractedReport)
+            self.assertEqual(contents.size, len(json_bytes))
+            self.check_v11(contents.json_data, json_bytes)
+            # Files which cannot be memory-mapped are read in full instead.
+            with mock.patch("mmap.mmap", side_effect=OSError(19, "No such device")):
+                contents, mtime = mci.read_file_bytes(path)
+            self.assertEqual(contents, json_bytes)
+
+if __name__ == "__main__":
+    unittest.main()